@@ -1,3 +1,4 @@
+import math
 import os
 import sys
 from dotenv import load_dotenv
@@ -7,13 +8,14 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 # Cargar variables de entorno ANTES de importar rutas que inicializan servicios
 load_dotenv()
 
-from flask import Flask, send_from_directory
+from flask import Flask, g, request, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
 from src.routes.chat import chat_bp
 from src.routes.budget import budget_bp
 from src.routes.knowledge import knowledge_bp
+from src.services.hdl_api import set_request_deadline, reset_request_deadline
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'change-me')
 
@@ -25,6 +27,28 @@ app.register_blueprint(chat_bp, url_prefix='/api/chat')
 app.register_blueprint(budget_bp, url_prefix='/api/budget')
 app.register_blueprint(knowledge_bp, url_prefix='/api/knowledge')
 
+# Presupuesto de tiempo (segundos) de cada request para las llamadas a HDL (0 = sin límite);
+# el cliente puede pedir uno menor con el header X-Request-Budget
+REQUEST_BUDGET = float(os.getenv('HDL_REQUEST_BUDGET', '10')) or None
+
+@app.before_request
+def start_request_budget():
+    budget = REQUEST_BUDGET
+    try:
+        requested = float(request.headers.get('X-Request-Budget', ''))
+        # Sólo el entorno puede quitar el límite: 0 en el header es "no esperar a HDL"
+        if math.isfinite(requested):
+            budget = max(0.0, requested) if budget is None else min(budget, max(0.0, requested))
+    except ValueError:
+        pass
+    g.hdl_deadline_token = set_request_deadline(budget)
+
+@app.teardown_request
+def end_request_budget(exc):
+    token = g.pop('hdl_deadline_token', None)
+    if token is not None:
+        reset_request_deadline(token)
+
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
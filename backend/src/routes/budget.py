@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, send_file
 from src.services.pdf_service import PDFService
 from src.services.simple_ai_service import SimpleAIService
+from src.services.hdl_api import get_hdl_service
+from src.services.budget_summaries import BudgetSummaryService
 import os
 import tempfile
 from datetime import datetime
@@ -9,11 +11,15 @@ import json
 budget_bp = Blueprint('budget', __name__)
 pdf_service = PDFService()
 ai_service = SimpleAIService()
+hdl_service = get_hdl_service()
+# Resúmenes cacheados por contenido de las líneas y generados en segundo plano
+budget_summaries = BudgetSummaryService(ai_service.generate_budget_summary, version='simple')
 
 @budget_bp.route('/generate', methods=['POST'])
 def generate_budget():
     """
-    Genera un presupuesto basado en los items seleccionados
+    Genera un presupuesto basado en los items seleccionados. Si el resumen no está listo
+    a tiempo, summary es null y se obtiene después con GET /summary/<summary_id>
     """
     try:
         data = request.get_json()
@@ -30,8 +36,8 @@ def generate_budget():
         iva = subtotal * 0.21
         total = subtotal + iva
         
-        # Generar resumen con IA
-        summary = ai_service.generate_budget_summary(items)
+        # Generar resumen (cacheado por contenido de las líneas, o en segundo plano)
+        summary_id, summary_result = budget_summaries.request(items)
         
         # Crear el presupuesto
         budget = {
@@ -42,7 +48,9 @@ def generate_budget():
             'subtotal': subtotal,
             'iva': iva,
             'total': total,
-            'summary': summary
+            'summary': summary_result['summary'],
+            'summary_id': summary_id,
+            'summary_status': summary_result['status']
         }
         
         return jsonify({
@@ -55,6 +63,113 @@ def generate_budget():
             'error': f'Error al generar presupuesto: {str(e)}'
         }), 500
 
+@budget_bp.route('/summary/<summary_id>', methods=['GET'])
+def get_budget_summary(summary_id):
+    """
+    Estado y resumen de un presupuesto generado ({status: ready | pending | failed, summary}).
+    Con ?wait=<segundos> (máximo 30) espera a que el resumen esté listo antes de responder.
+    """
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), 30)
+        if wait:
+            budget_summaries.wait(summary_id, wait)
+        result = budget_summaries.get(summary_id)
+        if result['status'] == 'unknown':
+            return jsonify({'error': 'Resumen no encontrado'}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener resumen: {str(e)}'
+        }), 500
+
+@budget_bp.route('/quote', methods=['POST'])
+def quote_budget():
+    """
+    Cotiza todas las líneas de un presupuesto en una lista de precios en una sola llamada.
+    Body: { codigo_lista, items: [{ codigo, cantidad }] }
+    """
+    try:
+        data = request.get_json() or {}
+        codigo_lista = str(data.get('codigo_lista') or '')
+        items = data.get('items', [])
+        
+        if not codigo_lista:
+            return jsonify({
+                'error': 'Se requiere el código de la lista de precios'
+            }), 400
+        
+        if not items:
+            return jsonify({
+                'error': 'No se proporcionaron items para el presupuesto'
+            }), 400
+        
+        try:
+            quote = hdl_service.quote_budget(codigo_lista, items)
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({
+                'error': 'Items inválidos: cada item debe tener codigo y una cantidad numérica'
+            }), 400
+        except OverflowError:
+            return jsonify({
+                'error': 'Las cantidades son demasiado grandes para calcular los totales'
+            }), 400
+        
+        if quote is None:
+            return jsonify({
+                'error': 'Lista de precios no encontrada'
+            }), 404
+        
+        return jsonify(quote)
+        
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al cotizar presupuesto: {str(e)}'
+        }), 500
+
+@budget_bp.route('/compare', methods=['POST'])
+def compare_budget():
+    """
+    Compara el total de un presupuesto en cada lista de precios de la obra.
+    Body: { codigo_obra, items: [{ codigo, cantidad }] }
+    """
+    try:
+        data = request.get_json() or {}
+        codigo_obra = str(data.get('codigo_obra') or '')
+        items = data.get('items', [])
+        
+        if not codigo_obra:
+            return jsonify({
+                'error': 'Se requiere el código de la obra'
+            }), 400
+        
+        if not items:
+            return jsonify({
+                'error': 'No se proporcionaron items para el presupuesto'
+            }), 400
+        
+        try:
+            comparison = hdl_service.compare_listas_obra(codigo_obra, items)
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({
+                'error': 'Items inválidos: cada item debe tener codigo y una cantidad numérica'
+            }), 400
+        except OverflowError:
+            return jsonify({
+                'error': 'Las cantidades son demasiado grandes para calcular los totales'
+            }), 400
+        
+        if comparison is None:
+            return jsonify({
+                'error': 'La obra no existe o no tiene listas de precios'
+            }), 404
+        
+        return jsonify(comparison)
+        
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al comparar listas de precios: {str(e)}'
+        }), 500
+
 @budget_bp.route('/generate-pdf', methods=['POST'])
 def generate_pdf():
     """
@@ -1,13 +1,116 @@
-from flask import Blueprint, request, jsonify
-from src.services.ai_service import AIService
-from src.services.hdl_api import HDLApiService
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.services.ai_service import PROMPT_VERSION, infer_client_search_term
+from src.services.budget_summaries import BudgetSummaryService
+from src.services.async_ai_service import AsyncAIService, Overloaded
+from src.services.hdl_api import get_hdl_service
+from src.services.pagination import parse_limit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as StageTimeout
 import base64
+import contextvars
 import json
+import os
 import time
 
 chat_bp = Blueprint('chat', __name__)
-ai_service = AIService()
-hdl_service = HDLApiService()
+ai_service = AsyncAIService()
+# Misma instancia que usan los servicios de IA (inicia el refresco periódico de HDL)
+hdl_service = get_hdl_service()
+# Resúmenes de presupuestos: cacheados por contenido y generados en segundo plano
+budget_summaries = BudgetSummaryService(
+    lambda items: ai_service.run(ai_service.generate_budget_summary_async(items)),
+    version=f"{ai_service.model}:{PROMPT_VERSION}",
+)
+
+def _prepare_message(data):
+    """Mensaje (con audios transcritos) y archivos procesados del request de chat"""
+    message = data.get('message', '')
+    files = data.get('files', [])
+    
+    # Procesar archivos si los hay
+    processed_files = []
+    for file_data in files:
+        if file_data.get('type') == 'image':
+            # El archivo ya viene en base64 desde el frontend
+            processed_files.append({
+                'type': 'image',
+                'data': file_data.get('data')
+            })
+        elif file_data.get('type') == 'audio':
+            # Transcribir audio
+            audio_bytes = base64.b64decode(file_data.get('data'))
+            transcription = ai_service.transcribe_audio(audio_bytes)
+            message += f" [Audio transcrito: {transcription}]"
+    return message, processed_files
+
+# Las etapas de un turno (modelo, búsqueda de productos y de clientes) corren en paralelo
+# en un pool acotado; cada una tiene su timeout y si no termina se responde sin su resultado
+STAGE_WORKERS = int(os.getenv('CHAT_STAGE_WORKERS', '16'))
+LLM_STAGE_TIMEOUT = float(os.getenv('CHAT_LLM_TIMEOUT', '30'))
+SEARCH_STAGE_TIMEOUT = float(os.getenv('CHAT_SEARCH_TIMEOUT', '3'))
+_stage_pool = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix='chat-stage')
+
+# Tope del tamaño de página de las búsquedas paginadas
+MAX_PAGE_LIMIT = 200
+# Tope de sugerencias por tipo en el autocompletado
+MAX_AUTOCOMPLETE_LIMIT = 20
+
+LLM_TIMEOUT_RESPONSE = (
+    'La respuesta del asistente está demorando más de lo habitual. '
+    'Mientras tanto, estos son los resultados encontrados; intente reenviar el mensaje.'
+)
+
+def _overloaded(e):
+    """503 con Retry-After cuando la cola de llamadas al modelo está llena"""
+    return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
+
+def _submit_stage(fn, *args):
+    """Ejecuta fn en el pool con el contexto del request (incluye el deadline de HDL)"""
+    return _stage_pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _stage_result(future, started, timeout, stage, incomplete, default):
+    """Resultado de la etapa, o default si no terminó a tiempo o falló (queda anotada en incomplete)"""
+    try:
+        return future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+    except StageTimeout:
+        # Si todavía no arrancó no ocupa el pool; si está corriendo termina en segundo plano
+        future.cancel()
+    except Exception:
+        pass
+    incomplete.append(stage)
+    return default
+
+def _start_searches(message):
+    """Lanza las búsquedas que sólo dependen del texto del mensaje, en paralelo con el modelo"""
+    client_term = infer_client_search_term(message)
+    return {
+        'started': time.monotonic(),
+        'products': _submit_stage(ai_service.search_products, message),
+        'client_term': client_term,
+        'clients': _submit_stage(hdl_service.search_clientes, client_term, 20) if client_term else None,
+    }
+
+def _collect_searches(searches, result, incomplete):
+    """
+    Productos (si el modelo los pide) y clientes/obras del turno. Si el modelo sugiere otro
+    término de cliente que el inferido del mensaje, esa búsqueda se hace recién ahora.
+    """
+    products = []
+    if result.get('needs_product_search'):
+        products = _stage_result(searches['products'], searches['started'], SEARCH_STAGE_TIMEOUT,
+                                 'products', incomplete, [])
+    else:
+        searches['products'].cancel()
+
+    clients = []
+    client_term = result.get('client_search_term')
+    if client_term:
+        future, started = searches['clients'], searches['started']
+        if future is None or client_term != searches['client_term']:
+            future, started = _submit_stage(hdl_service.search_clientes, client_term, 20), time.monotonic()
+        clients = _stage_result(future, started, SEARCH_STAGE_TIMEOUT, 'clients', incomplete, [])
+    elif searches['clients'] is not None:
+        searches['clients'].cancel()
+    return products, clients
 
 @chat_bp.route('/message', methods=['POST'])
 def process_message():
@@ -17,56 +120,33 @@ def process_message():
     try:
         data = request.get_json()
         
-        message = data.get('message', '')
-        conversation_history = data.get('history', [])
-        files = data.get('files', [])
-        
-        if not message and not files:
+        if not data.get('message', '') and not data.get('files', []):
             return jsonify({
                 'error': 'Mensaje o archivos requeridos'
             }), 400
         
-        # Procesar archivos si los hay
-        processed_files = []
-        for file_data in files:
-            if file_data.get('type') == 'image':
-                # El archivo ya viene en base64 desde el frontend
-                processed_files.append({
-                    'type': 'image',
-                    'data': file_data.get('data')
-                })
-            elif file_data.get('type') == 'audio':
-                # Transcribir audio
-                audio_bytes = base64.b64decode(file_data.get('data'))
-                transcription = ai_service.transcribe_audio(audio_bytes)
-                message += f" [Audio transcrito: {transcription}]"
+        message, processed_files = _prepare_message(data)
+        conversation_history = data.get('history', [])
         
-        # Procesar mensaje con IA
-        result = ai_service.process_message(message, conversation_history, processed_files)
+        # Procesar mensaje con IA mientras se buscan productos y clientes
+        started = time.monotonic()
+        llm = ai_service.submit(ai_service.process_message_async(
+            message, conversation_history, processed_files, data.get('codigo_lista')))
+        searches = _start_searches(message)
+        incomplete = []
+        try:
+            result = llm.result(timeout=LLM_STAGE_TIMEOUT - (time.monotonic() - started))
+        except StageTimeout:
+            llm.cancel()
+            incomplete.append('llm')
+            # Sin respuesta del modelo: se muestra lo que hayan encontrado las búsquedas
+            result = {
+                'response': LLM_TIMEOUT_RESPONSE,
+                'needs_product_search': True,
+                'client_search_term': searches['client_term'],
+            }
         
-        # Buscar productos si es necesario
-        products = []
-        if result.get('needs_product_search'):
-            products = ai_service.search_products(message)
-
-        # Búsqueda de clientes/obras si el modelo lo sugiere
-        clients = []
-        client_search_term = result.get('client_search_term')
-        if not client_search_term:
-            # Inferir término desde el mensaje si el modelo no lo dio
-            try:
-                msg_lower = (message or '').lower()
-                import re
-                m = re.search(r"\bbusc(?:a|ar)\s+a\s+([a-záéíóúñü\-\s]{2,})", msg_lower)
-                if not m:
-                    m = re.search(r"\bbusc(?:a|ar)\s+([a-záéíóúñü\-]{3,})", msg_lower)
-                if m:
-                    client_search_term = m.group(1).strip().split(' en ')[0][:50]
-            except Exception:
-                client_search_term = None
-
-        if client_search_term:
-            clients = hdl_service.search_clientes(client_search_term, limit=20)
+        products, clients = _collect_searches(searches, result, incomplete)
         
         return jsonify({
             'response': result['response'],
@@ -74,34 +154,115 @@ def process_message():
             'next_step': result.get('next_step', 'continue'),
             'products': products[:10],  # Limitar a 10 productos
             'clients': clients[:10],    # Limitar a 10 clientes/obras
+            'incomplete': incomplete,   # Etapas que no terminaron a tiempo (llm, products, clients)
             'timestamp': data.get('timestamp')
         })
         
+    except Overloaded as e:
+        return _overloaded(e)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al procesar mensaje: {str(e)}'
+        }), 500
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@chat_bp.route('/message/stream', methods=['POST'])
+def process_message_stream():
+    """
+    Variante en streaming (Server-Sent Events) de /message. Eventos, en orden:
+    token ({text}) con partes de la respuesta a medida que llegan, message ({response,
+    quick_replies, next_step}), products ({products}), clients ({clients}) y done ({incomplete}).
+    Si no hay lugar para llamar al modelo responde 503 con Retry-After antes de abrir el stream.
+    Ante un error posterior se emite error ({error}) y se corta el stream.
+    """
+    data = request.get_json() or {}
+    
+    if not data.get('message', '') and not data.get('files', []):
+        return jsonify({
+            'error': 'Mensaje o archivos requeridos'
+        }), 400
+    
+    try:
+        message, processed_files = _prepare_message(data)
+        # Devuelve recién cuando la llamada tiene lugar en el limitador (o lanza Overloaded)
+        events = ai_service.process_message_stream(
+            message, data.get('history', []), processed_files, data.get('codigo_lista'))
+        try:
+            # Las búsquedas se lanzan acá y no en generate(): el stream se consume después del
+            # teardown del request, que ya restableció el deadline de HDL
+            searches = _start_searches(message)
+        except Exception:
+            events.close()
+            raise
+    except Overloaded as e:
+        return _overloaded(e)
     except Exception as e:
         return jsonify({
             'error': f'Error al procesar mensaje: {str(e)}'
         }), 500
+    
+    def generate():
+        # Comentario inicial: el cliente recibe los headers y el primer byte de inmediato
+        yield ": stream\n\n"
+        try:
+            result = {}
+            for kind, value in events:
+                if kind == 'token':
+                    yield _sse('token', {'text': value})
+                else:
+                    result = value
+            yield _sse('message', {
+                'response': result['response'],
+                'quick_replies': result.get('quick_replies', []),
+                'next_step': result.get('next_step', 'continue'),
+                'timestamp': data.get('timestamp')
+            })
+            
+            incomplete = []
+            products, clients = _collect_searches(searches, result, incomplete)
+            yield _sse('products', {'products': products[:10]})
+            yield _sse('clients', {'clients': clients[:10]})
+            yield _sse('done', {'incomplete': incomplete})
+        except Exception as e:
+            yield _sse('error', {'error': f'Error al procesar mensaje: {str(e)}'})
+        finally:
+            events.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Evita que un proxy (nginx) acumule la respuesta antes de enviarla
+        'X-Accel-Buffering': 'no',
+    })
 
 @chat_bp.route('/search-products', methods=['POST'])
 def search_products():
     """
-    Busca productos en el catálogo HDL
+    Busca productos en el catálogo HDL, paginado: total es la cantidad de coincidencias
+    y next_cursor (si no es null) se envía como cursor para pedir la página siguiente
     """
     try:
         data = request.get_json()
         query = data.get('query', '')
-        limit = data.get('limit', 50)
+        fuzzy = bool(data.get('fuzzy', False))
+        cursor = data.get('cursor')
         
         if not query:
             return jsonify({
                 'error': 'Query de búsqueda requerido'
             }), 400
         
-        products = hdl_service.search_articulos(query, limit)
+        try:
+            limit = parse_limit(data.get('limit'), 50, MAX_PAGE_LIMIT)
+            page = hdl_service.search_articulos_page(query, limit, cursor=cursor, fuzzy=fuzzy)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
-            'products': products,
-            'total': len(products)
+            'products': page['items'],
+            'total': page['total'],
+            'next_cursor': page['next_cursor']
         })
         
     except Exception as e:
@@ -113,21 +274,44 @@ def search_products():
 @chat_bp.route('/search-clients', methods=['POST'])
 def search_clients():
     """
-    Busca clientes y/o obras por término (razón social, CUIT o nombre de obra)
+    Busca clientes y/o obras por término (razón social, CUIT o nombre de obra), paginado con cursor
     """
     try:
         data = request.get_json()
         query = data.get('query', '')
-        limit = data.get('limit', 50)
+        cursor = data.get('cursor')
 
         if not query:
             return jsonify({'error': 'Query de búsqueda requerido'}), 400
 
-        clients = hdl_service.search_clientes(query, limit)
-        return jsonify({'clients': clients, 'total': len(clients)})
+        try:
+            limit = parse_limit(data.get('limit'), 50, MAX_PAGE_LIMIT)
+            page = hdl_service.search_clientes_page(query, limit, cursor=cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'clients': page['items'], 'total': page['total'], 'next_cursor': page['next_cursor']})
     except Exception as e:
         return jsonify({'error': f'Error al buscar clientes: {str(e)}'}), 500
 
+@chat_bp.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    """
+    Sugerencias por prefijo mientras se escribe (artículos, clientes y obras)
+    """
+    try:
+        query = request.args.get('q', '')
+        try:
+            limit = parse_limit(request.args.get('limit'), 8, MAX_AUTOCOMPLETE_LIMIT)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not query.strip():
+            return jsonify({'articulos': [], 'clientes': []})
+
+        return jsonify(hdl_service.autocomplete(query, limit))
+    except Exception as e:
+        return jsonify({'error': f'Error al autocompletar: {str(e)}'}), 500
+
 @chat_bp.route('/product/<codigo>', methods=['GET'])
 def get_product(codigo):
     """
@@ -150,6 +334,19 @@ def get_product(codigo):
             'error': f'Error al obtener producto: {str(e)}'
         }), 500
 
+@chat_bp.route('/catalog/changes', methods=['GET'])
+def get_catalog_changes():
+    """
+    Feed de cambios del catálogo (altas, bajas y cambios de precio) desde una versión dada
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        return jsonify(hdl_service.get_catalog_changes(since))
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener cambios del catálogo: {str(e)}'
+        }), 500
+
 @chat_bp.route('/societies', methods=['GET'])
 def get_societies():
     """
@@ -202,10 +399,12 @@ def analyze_image():
         if ',' in image_data:
             image_data = image_data.split(',')[1]
         
-        result = ai_service.analyze_image(image_data)
+        result = ai_service.run(ai_service.analyze_image_async(image_data))
         
         return jsonify(result)
         
+    except Overloaded as e:
+        return _overloaded(e)
     except Exception as e:
         return jsonify({
             'error': f'Error al analizar imagen: {str(e)}'
@@ -214,7 +413,9 @@ def analyze_image():
 @chat_bp.route('/generate-budget', methods=['POST'])
 def generate_budget():
     """
-    Genera un presupuesto basado en los items seleccionados
+    Genera un presupuesto basado en los items seleccionados. Los totales vuelven enseguida;
+    si el resumen todavía se está generando, summary es null y se obtiene después con
+    GET /budget-summary/<summary_id>
     """
     try:
         data = request.get_json()
@@ -226,8 +427,8 @@ def generate_budget():
                 'error': 'Items requeridos para generar presupuesto'
             }), 400
         
-        # Generar resumen con IA
-        summary = ai_service.generate_budget_summary(items)
+        # Resumen con IA (cacheado por contenido de las líneas, o en segundo plano)
+        summary_id, summary_result = budget_summaries.request(items)
         
         # Calcular totales
         subtotal = sum(item.get('total', 0) for item in items)
@@ -241,7 +442,9 @@ def generate_budget():
             'subtotal': subtotal,
             'iva': iva,
             'total': total,
-            'summary': summary,
+            'summary': summary_result['summary'],
+            'summary_id': summary_id,
+            'summary_status': summary_result['status'],
             'created_at': time.time()
         }
         
@@ -254,6 +457,48 @@ def generate_budget():
             'error': f'Error al generar presupuesto: {str(e)}'
         }), 500
 
+@chat_bp.route('/budget-summary/<summary_id>', methods=['GET'])
+def get_budget_summary(summary_id):
+    """
+    Estado y resumen de un presupuesto generado ({status: ready | pending | failed, summary}).
+    Con ?wait=<segundos> (máximo 30) espera a que el resumen esté listo antes de responder.
+    """
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), 30)
+        if wait:
+            budget_summaries.wait(summary_id, wait)
+        result = budget_summaries.get(summary_id)
+        if result['status'] == 'unknown':
+            return jsonify({'error': 'Resumen no encontrado'}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener resumen: {str(e)}'
+        }), 500
+
+@chat_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Devuelve métricas del cache de HDL (hits, misses, requests coalescidos, etc.)
+    y del cache de respuestas del modelo (null si está desactivado), más la concurrencia
+    de llamadas al modelo (en curso, en espera y rechazadas) y los turnos respondidos por el
+    clasificador local de intents sin llamar al modelo, el historial enviado (tokens y resúmenes)
+    y el contexto recuperado (conocimiento y artículos), más los resúmenes de presupuestos
+    """
+    try:
+        metrics = hdl_service.get_metrics()
+        metrics['ai_response_cache'] = ai_service.get_cache_metrics()
+        metrics['ai_concurrency'] = ai_service.get_concurrency_metrics()
+        metrics['intent_fast_path'] = ai_service.get_intent_metrics()
+        metrics['conversation_memory'] = ai_service.get_memory_metrics()
+        metrics['retrieval'] = ai_service.get_retrieval_metrics()
+        metrics['budget_summaries'] = budget_summaries.get_metrics()
+        return jsonify(metrics)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener métricas: {str(e)}'
+        }), 500
+
 @chat_bp.route('/clear-cache', methods=['POST'])
 def clear_cache():
     """
@@ -1,13 +1,11 @@
 from flask import Blueprint, request, jsonify
+from src.services.retrieval import KNOWLEDGE_DIR
 import os
 import json
 from datetime import datetime
 
 knowledge_bp = Blueprint('knowledge', __name__)
 
-# Directorio para almacenar el conocimiento
-KNOWLEDGE_DIR = '/tmp/knowledge'
-
 def ensure_knowledge_dir():
     """Asegura que el directorio de conocimiento existe"""
     os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
@@ -1,9 +1,15 @@
 import os
+import re
 import json
-from typing import Dict, List, Optional, Any
+import hashlib
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 
 from openai import OpenAI
-from src.services.hdl_api import HDLApiService
+from src.services.hdl_api import get_hdl_service
+from src.services.conversation_memory import ConversationMemory, TokenCounter
+from src.services.intent_classifier import IntentClassifier
+from src.services.retrieval import Retriever
+from src.services.result_cache import ResultCache, SQLiteResultCache
 
 
 SYSTEM_PROMPT = (
@@ -14,50 +20,163 @@ SYSTEM_PROMPT = (
     "(cliente, obra, lista de precios, cantidades y materiales)."
 )
 
+SCHEMA_INSTRUCTIONS = (
+    "Responde SOLO en JSON estricto con las claves: "
+    "response (string), quick_replies (array de strings), next_step (string), "
+    "needs_product_search (boolean), client_search_term (string|null). "
+    "Si el usuario pide buscar un cliente/obra (ej. 'Walter'), establece client_search_term al término de búsqueda. "
+    "Ejemplo: {\"response\":\"...\",\"quick_replies\":[\"...\"],\"next_step\":\"...\",\"needs_product_search\":false,\"client_search_term\":null}"
+)
+
+# Cambia con cualquier edición de los prompts: invalida las respuestas cacheadas
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + SCHEMA_INSTRUCTIONS).encode("utf-8")).hexdigest()[:12]
+
+
+class _JsonFieldStreamer:
+    """
+    Extrae incrementalmente el valor (string) de una clave de un objeto JSON que llega
+    por partes, para reenviar el texto de la respuesta a medida que el modelo lo genera.
+    """
+
+    def __init__(self, field: str):
+        self._key_re = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None  # inicio del string, una vez encontrada la clave
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Agrega texto recibido y devuelve la parte nueva (ya decodificada) del valor"""
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if self._pos is None:
+            match = self._key_re.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+        out = []
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                out.append(char)
+                pos += 1
+                continue
+            # Secuencia de escape: se decodifica sólo cuando está completa (incluidos pares surrogados)
+            size = 2
+            if buffer[pos + 1:pos + 2] == "u":
+                size = 6
+                if pos + size > len(buffer):
+                    break
+                if 0xD800 <= int(buffer[pos + 2:pos + 6], 16) <= 0xDBFF:
+                    size = 12
+            if pos + size > len(buffer):
+                break
+            try:
+                out.append(json.loads('"' + buffer[pos:pos + size] + '"'))
+            except ValueError:
+                pass
+            pos += size
+        self._pos = pos
+        return "".join(out)
+
+    @property
+    def found(self) -> bool:
+        return self._pos is not None
+
+
+def infer_client_search_term(message: str) -> Optional[str]:
+    """Término de búsqueda de cliente/obra pedido en el mensaje ("busca a <nombre>"), o None"""
+    ml = (message or "").lower()
+    # patrones simples: "busca a <nombre>", "buscar a <nombre>", "busca <nombre>"
+    m = re.search(r"\bbusc(?:a|ar)\s+a\s+([a-záéíóúñü\-\s]{2,})", ml)
+    if not m:
+        m = re.search(r"\bbusc(?:a|ar)\s+([a-záéíóúñü\-]{3,})", ml)
+    if not m:
+        return None
+    term = m.group(1).strip()
+    # limpiar posibles sufijos comunes
+    term = term.split(" en ")[0].split(" del ")[0].split(" de ")[0].strip()
+    # limitar longitud
+    return term[:50] or None
+
+
+def create_response_cache():
+    """
+    Cache opcional de respuestas del modelo según AI_RESPONSE_CACHE:
+    'off' (por defecto), 'memory' (por proceso) o 'sqlite' (compartido entre procesos y reinicios).
+    """
+    backend = os.getenv("AI_RESPONSE_CACHE", "off").lower()
+    ttl = float(os.getenv("AI_RESPONSE_CACHE_TTL", "3600"))
+    if backend == "memory":
+        return ResultCache(int(os.getenv("AI_RESPONSE_CACHE_BYTES", str(4 * 1024 * 1024))), ttl)
+    if backend == "sqlite":
+        return SQLiteResultCache(
+            os.getenv("AI_RESPONSE_CACHE_PATH", "/tmp/ai_cache/responses.sqlite"),
+            int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+            ttl,
+        )
+    return None
+
 
 class AIService:
     """Servicio de IA con OpenAI para respuestas naturales y estructuradas."""
+
+    # Tope (tokens) del mensaje del usuario
+    MESSAGE_TOKENS = int(os.getenv("AI_MESSAGE_TOKENS", "1500"))
     
     def __init__(self):
         api_key = os.getenv("OPEN_AI_KEY") or os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("Falta OPEN_AI_KEY/OPENAI_API_KEY en el entorno")
 
-        self.client = OpenAI(api_key=api_key)
+        # OPENAI_API_BASE permite apuntar a un servidor compatible (por ejemplo, uno local de prueba)
+        self.client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_API_BASE") or None)
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        self.hdl_service = HDLApiService()
+        self.hdl_service = get_hdl_service()
+        self.response_cache = create_response_cache()
+        self.intent_classifier = IntentClassifier()
+        self.memory = ConversationMemory(TokenCounter(self.model))
+        self.retriever = Retriever(self.hdl_service, self.memory.counter)
+    
+    def _response_cache_key(self, user_content: str, history_messages: List[Dict]) -> str:
+        """Hash del mensaje normalizado, la ventana de historial enviada y la versión de modelo/prompt"""
+        state = {
+            "message": " ".join(user_content.lower().split()),
+            "history": [[turn["role"], " ".join(turn["content"].split())] for turn in history_messages],
+            "model": self.model,
+            "prompt": PROMPT_VERSION,
+        }
+        return hashlib.sha256(json.dumps(state, ensure_ascii=False).encode("utf-8")).hexdigest()
+    
+    def get_cache_metrics(self) -> Optional[Dict]:
+        return self.response_cache.get_metrics() if self.response_cache is not None else None
+
+    def get_intent_metrics(self) -> Dict:
+        return self.intent_classifier.get_metrics()
+
+    def get_memory_metrics(self) -> Dict:
+        return self.memory.get_metrics()
+
+    def get_retrieval_metrics(self) -> Dict:
+        return self.retriever.get_metrics()
         
-    def process_message(self, message: str, conversation_history: List[Dict], files: Optional[List[Dict]] = None) -> Dict:
+    def process_message(self, message: str, conversation_history: List[Dict], files: Optional[List[Dict]] = None,
+                        codigo_lista: Optional[str] = None) -> Dict:
         """
         Procesa el mensaje con un modelo de lenguaje. Devuelve un dict con:
         - response: texto de respuesta
         - quick_replies: lista de sugerencias (opcional)
         - next_step: sugerencia de próximo paso (opcional)
         - needs_product_search: bool indicando si conviene buscar productos
+        codigo_lista (opcional) es la lista de precios elegida para los artículos del contexto.
         """
-        history_messages = []
-        for turn in conversation_history[-10:]:
-            # Limitar historial a las últimas 10 entradas para evitar prompts enormes
-            role = "user" if turn.get("role") == "user" else "assistant"
-            content = str(turn.get("content", ""))[:4000]
-            if content:
-                history_messages.append({"role": role, "content": content})
-
-        user_content = message.strip()[:6000]
-
-        schema_instructions = (
-            "Responde SOLO en JSON estricto con las claves: "
-            "response (string), quick_replies (array de strings), next_step (string), "
-            "needs_product_search (boolean), client_search_term (string|null). "
-            "Si el usuario pide buscar un cliente/obra (ej. 'Walter'), establece client_search_term al término de búsqueda. "
-            "Ejemplo: {\"response\":\"...\",\"quick_replies\":[\"...\"],\"next_step\":\"...\",\"needs_product_search\":false,\"client_search_term\":null}"
-        )
-
-        messages = (
-            [{"role": "system", "content": SYSTEM_PROMPT + " " + schema_instructions}]
-            + history_messages
-            + [{"role": "user", "content": user_content}]
-        )
+        messages, cache_key, ready = self._prepare_messages(message, conversation_history, files, codigo_lista)
+        if ready is not None:
+            return self._complete_response(dict(ready), message)
 
         completion = self.client.chat.completions.create(
             model=self.model,
@@ -66,17 +185,101 @@ class AIService:
         )
 
         text = completion.choices[0].message.content or "{}"
+        return self._complete_response(self._parse_reply(text, cache_key), message)
+
+    def process_message_stream(self, message: str, conversation_history: List[Dict],
+                               files: Optional[List[Dict]] = None,
+                               codigo_lista: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Variante en streaming de process_message: genera ("token", texto) con el texto de la
+        respuesta a medida que llega del modelo y al final ("result", dict) con el mismo
+        contenido que devuelve process_message.
+        """
+        messages, cache_key, ready = self._prepare_messages(message, conversation_history, files, codigo_lista)
+        if ready is not None:
+            data = self._complete_response(dict(ready), message)
+            yield "token", data["response"]
+            yield "result", data
+            return
+
+        stream = self.client.chat.completions.create(
+            model=self.model,
+                messages=messages,
+            temperature=0.2,
+            stream=True,
+        )
+        streamer = _JsonFieldStreamer("response")
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            token = streamer.feed(delta)
+            if token:
+                yield "token", token
+
+        text = "".join(parts) or "{}"
+        data = self._complete_response(self._parse_reply(text, cache_key), message)
+        if not streamer.found:
+            # El modelo no respondió JSON: el texto completo es la respuesta
+            yield "token", data["response"]
+        yield "result", data
+
+    def _prepare_messages(self, message: str, conversation_history: List[Dict], files: Optional[List[Dict]],
+                          codigo_lista: Optional[str] = None):
+        """
+        Mensajes para el modelo, clave de cache del turno y respuesta ya disponible sin llamar
+        al modelo (del clasificador local de intents o del cache), si la hay
+        """
+        # Turnos triviales (saludos, clicks en respuestas rápidas): se responden localmente
+        local = self.intent_classifier.respond(message, files)
+        if local is not None:
+            return None, None, local
+
+        # Historial dentro del presupuesto de tokens (los turnos viejos van resumidos)
+        history_messages, facts = self.memory.build(conversation_history)
+
+        user_content = self.memory.counter.truncate(message.strip(), self.MESSAGE_TOKENS)
+
+        # Conocimiento y artículos (con precios de la lista elegida) relevantes para el mensaje;
+        # forma parte de la clave de cache, así que un cambio de precios no sirve respuestas viejas
+        context = self.retriever.context(user_content, facts, codigo_lista)
+        if context:
+            history_messages = [{"role": "system", "content": context}] + history_messages
+
+        # Sólo se cachean turnos de texto (sin imágenes ni audio)
+        cache_key, cached = None, None
+        if self.response_cache is not None and not files:
+            cache_key = self._response_cache_key(user_content, history_messages)
+            cached = self.response_cache.get(cache_key, None)
+
+        messages = (
+            [{"role": "system", "content": SYSTEM_PROMPT + " " + SCHEMA_INSTRUCTIONS}]
+            + history_messages
+            + [{"role": "user", "content": user_content}]
+        )
+        return messages, cache_key, cached
+
+    def _parse_reply(self, text: str, cache_key: Optional[str]) -> Dict:
+        """Interpreta la respuesta JSON del modelo (y la cachea si corresponde)"""
         try:
             data = json.loads(text)
+            if cache_key is not None and isinstance(data, dict):
+                self.response_cache.set(cache_key, None, data)
+                data = dict(data)
+            return data
         except Exception:
             # Fallback mínimo a formato esperado
-            data = {
+            return {
                 "response": text.strip(),
                 "quick_replies": [],
                 "next_step": "continue_conversation",
                 "needs_product_search": False,
             }
 
+    def _complete_response(self, data: Dict, message: str) -> Dict:
+        """Completa las claves esperadas y aplica las heurísticas sobre el mensaje original"""
         # Garantizar claves
         data.setdefault("response", "")
         data.setdefault("quick_replies", [])
@@ -86,20 +289,9 @@ class AIService:
 
         # Heurística: si la IA no marcó client_search_term, intentar inferirlo del mensaje
         if not data.get("client_search_term"):
-            ml = message.lower()
-            # patrones simples: "busca a <nombre>", "buscar a <nombre>", "busca <nombre>"
-            import re
-            m = re.search(r"\bbusc(?:a|ar)\s+a\s+([a-záéíóúñü\-\s]{2,})", ml)
-            if not m:
-                m = re.search(r"\bbusc(?:a|ar)\s+([a-záéíóúñü\-]{3,})", ml)
-            if m:
-                term = m.group(1).strip()
-                # limpiar posibles sufijos comunes
-                term = term.split(" en ")[0].split(" del ")[0].split(" de ")[0].strip()
-                # limitar longitud
-                term = term[:50]
-                if term:
-                    data["client_search_term"] = term
+            term = infer_client_search_term(message)
+            if term:
+                data["client_search_term"] = term
 
         # Fallback de quick replies útiles si la IA no las entrega
         if not data.get("quick_replies"):
@@ -115,29 +307,35 @@ class AIService:
 
     def search_products(self, query: str) -> List[Dict]:
         try:
-            return self.hdl_service.search_articulos(query)
+            return self.hdl_service.search_articulos(query, fuzzy=True)
         except Exception:
             return []
     
     def analyze_image(self, image_base64: str) -> Dict[str, Any]:
         """Analiza una imagen con un prompt de clasificación simple."""
         try:
-            # Usamos multimodal si el modelo lo soporta; para simplicidad, devolvemos texto clasificado
-            messages = [
-                {"role": "system", "content": "Extrae materiales y señales útiles de la imagen. Responde en JSON con 'analysis' y 'materials_detected'"},
-                    {
-                        "role": "user",
-                        "content": [
-                        {"type": "input_text", "text": "Analiza la imagen y sugiere categorías de materiales"},
-                        {"type": "input_image", "image_data": image_base64},
-                    ],
-                },
-            ]
-            completion = self.client.chat.completions.create(model=self.model, messages=messages, temperature=0)
+            completion = self.client.chat.completions.create(
+                model=self.model, messages=self._image_messages(image_base64), temperature=0)
             text = completion.choices[0].message.content or "{}"
             return json.loads(text)
         except Exception:
-            return {"analysis": "Imagen recibida.", "materials_detected": []}
+            return self._image_fallback()
+
+    def _image_messages(self, image_base64: str) -> List[Dict]:
+        # Usamos multimodal si el modelo lo soporta; para simplicidad, devolvemos texto clasificado
+        return [
+            {"role": "system", "content": "Extrae materiales y señales útiles de la imagen. Responde en JSON con 'analysis' y 'materials_detected'"},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": "Analiza la imagen y sugiere categorías de materiales"},
+                    {"type": "input_image", "image_data": image_base64},
+                ],
+            },
+        ]
+
+    def _image_fallback(self) -> Dict[str, Any]:
+        return {"analysis": "Imagen recibida.", "materials_detected": []}
 
     def transcribe_audio(self, audio_bytes: bytes) -> str:
         """Transcribe audio si está disponible; si no, devuelve cadena vacía."""
@@ -148,26 +346,33 @@ class AIService:
             return ""
     
     def generate_budget_summary(self, items: List[Dict]) -> Dict:
-        total = sum(item.get("total", 0) for item in items)
-        prompt = (
-            "Genera un breve resumen ejecutivo del presupuesto en 3-5 líneas. "
-            "No inventes materiales ni precios. Solo resume cantidades y total. "
-            f"Total: {total:.2f}. Formato JSON: {{\"summary\": string, \"total_amount\": number, \"item_count\": number}}"
-        )
+        messages, total = self._budget_summary_messages(items)
         try:
             completion = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=messages,
                 temperature=0.2,
             )
             text = completion.choices[0].message.content or "{}"
-            data = json.loads(text)
-            data.setdefault("total_amount", total)
-            data.setdefault("item_count", len(items))
-            return data
+            return self._parse_budget_summary(text, total, items)
         except Exception:
             return {"summary": "", "total_amount": total, "item_count": len(items)}
 
+    def _budget_summary_messages(self, items: List[Dict]) -> Tuple[List[Dict], float]:
+        total = sum(item.get("total", 0) for item in items)
+        prompt = (
+            "Genera un breve resumen ejecutivo del presupuesto en 3-5 líneas. "
+            "No inventes materiales ni precios. Solo resume cantidades y total. "
+            f"Total: {total:.2f}. Formato JSON: {{\"summary\": string, \"total_amount\": number, \"item_count\": number}}"
+        )
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        return messages, total
+
+    def _parse_budget_summary(self, text: str, total: float, items: List[Dict]) -> Dict:
+        data = json.loads(text)
+        data.setdefault("total_amount", total)
+        data.setdefault("item_count", len(items))
+        return data
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, Coroutine, Dict, Iterator, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+from src.services.ai_service import AIService, _JsonFieldStreamer
+
+
+class Overloaded(Exception):
+    """No hay lugar en la cola de espera del modelo: el llamador debe reintentar más tarde"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Servicio de IA saturado, reintente en {retry_after} s")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Semáforo global de llamadas al modelo con una cola de espera acotada.
+    Si la cola está llena (o la espera supera queue_timeout) se rechaza la llamada con
+    Overloaded, estimando el Retry-After con la latencia media y la cola actual.
+    Se usa sólo desde el event loop del servicio.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self._avg_latency: Optional[float] = None
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'queue_timeouts': 0,
+        }
+
+    def retry_after(self) -> int:
+        latency = self._avg_latency or 1.0
+        return max(1, math.ceil(latency * (self._waiting + 1) / self.max_concurrency))
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise Overloaded(self.retry_after())
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats['queue_timeouts'] += 1
+            raise Overloaded(self.retry_after())
+        finally:
+            self._waiting -= 1
+
+        self.stats['admitted'] += 1
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            elapsed = time.monotonic() - started
+            # Media móvil exponencial de la latencia del modelo
+            self._avg_latency = elapsed if self._avg_latency is None else 0.8 * self._avg_latency + 0.2 * elapsed
+
+    def get_metrics(self) -> Dict:
+        metrics = dict(self.stats)
+        metrics.update({
+            'in_flight': self._in_flight,
+            'waiting': self._waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'avg_latency': round(self._avg_latency, 3) if self._avg_latency is not None else None,
+        })
+        return metrics
+
+
+class AsyncAIService(AIService):
+    """
+    AIService con variantes async de process_message, analyze_image y generate_budget_summary
+    sobre un AsyncOpenAI compartido (un único pool de conexiones por proceso).
+    Las corrutinas corren en un event loop propio, en un hilo de fondo: las rutas Flask las
+    envían con submit/run y la espera no abre una conexión ni un hilo nuevo por llamada.
+    Todas las llamadas al modelo de estas variantes y del streaming pasan por el ConcurrencyLimiter.
+    """
+
+    MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "32"))
+    MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "64"))
+    QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "10"))
+
+    def __init__(self):
+        super().__init__()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_pid: Optional[int] = None
+        self._loop_lock = threading.Lock()
+        self.async_client: Optional[AsyncOpenAI] = None
+        self.limiter = ConcurrencyLimiter(self.MAX_CONCURRENCY, self.MAX_QUEUE, self.QUEUE_TIMEOUT)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop del servicio; se crea al primer uso (y de nuevo en cada proceso hijo de un fork)"""
+        with self._loop_lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ai-async-loop", daemon=True).start()
+                self._loop, self._loop_pid = loop, os.getpid()
+                # El cliente y el semáforo quedan ligados a este loop
+                self.async_client = AsyncOpenAI(api_key=self.client.api_key, base_url=self.client.base_url)
+                self.limiter = ConcurrencyLimiter(self.MAX_CONCURRENCY, self.MAX_QUEUE, self.QUEUE_TIMEOUT)
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Programa la corrutina en el loop del servicio; cancelar el Future cancela la llamada"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Ejecuta la corrutina y espera su resultado desde código sincrónico"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def get_concurrency_metrics(self) -> Dict:
+        return self.limiter.get_metrics()
+
+    async def _complete(self, **kwargs):
+        async with self.limiter.slot():
+            return await self.async_client.chat.completions.create(model=self.model, **kwargs)
+
+    async def process_message_async(self, message: str, conversation_history: List[Dict],
+                                    files: Optional[List[Dict]] = None,
+                                    codigo_lista: Optional[str] = None) -> Dict:
+        """Igual que process_message; puede lanzar Overloaded"""
+        # Historial, recuperación de contexto y cache son trabajo sincrónico: fuera del event loop
+        messages, cache_key, ready = await asyncio.to_thread(
+            self._prepare_messages, message, conversation_history, files, codigo_lista)
+        if ready is not None:
+            return self._complete_response(dict(ready), message)
+
+        completion = await self._complete(messages=messages, temperature=0.2)
+        text = completion.choices[0].message.content or "{}"
+        return self._complete_response(self._parse_reply(text, cache_key), message)
+
+    async def analyze_image_async(self, image_base64: str) -> Dict[str, Any]:
+        """Igual que analyze_image; puede lanzar Overloaded"""
+        try:
+            completion = await self._complete(messages=self._image_messages(image_base64), temperature=0)
+            text = completion.choices[0].message.content or "{}"
+            return json.loads(text)
+        except Overloaded:
+            raise
+        except Exception:
+            return self._image_fallback()
+
+    async def generate_budget_summary_async(self, items: List[Dict]) -> Dict:
+        """Igual que generate_budget_summary; puede lanzar Overloaded"""
+        messages, total = self._budget_summary_messages(items)
+        try:
+            completion = await self._complete(messages=messages, temperature=0.2)
+            text = completion.choices[0].message.content or "{}"
+            return self._parse_budget_summary(text, total, items)
+        except Overloaded:
+            raise
+        except Exception:
+            return {"summary": "", "total_amount": total, "item_count": len(items)}
+
+    def process_message_stream(self, message: str, conversation_history: List[Dict],
+                               files: Optional[List[Dict]] = None,
+                               codigo_lista: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Igual que AIService.process_message_stream, pero el stream del modelo corre en el loop
+        del servicio (AsyncOpenAI, dentro del ConcurrencyLimiter) y llega por una cola.
+        Espera a tener lugar antes de devolver el iterador: lanza Overloaded al llamarla, cuando
+        todavía se puede responder 503.
+        """
+        events: queue.Queue = queue.Queue()
+        future = self.submit(self._stream_message(events, message, conversation_history, files, codigo_lista))
+        kind, value = events.get()
+        if kind == "error":
+            raise value
+        return self._drain_stream(events, future)
+
+    def _drain_stream(self, events: queue.Queue, future: Future) -> Iterator[Tuple[str, Any]]:
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "error":
+                    raise value
+                yield kind, value
+                if kind == "result":
+                    return
+        finally:
+            # Si el cliente cortó el stream se cancela la llamada y se libera su lugar
+            future.cancel()
+
+    async def _stream_message(self, events: queue.Queue, message: str, conversation_history: List[Dict],
+                              files: Optional[List[Dict]], codigo_lista: Optional[str]):
+        """Publica en events: ("admitted", None), luego ("token", texto)... y ("result", dict), o ("error", e)"""
+        try:
+            messages, cache_key, ready = await asyncio.to_thread(
+                self._prepare_messages, message, conversation_history, files, codigo_lista)
+            if ready is not None:
+                data = self._complete_response(dict(ready), message)
+                events.put(("admitted", None))
+                events.put(("token", data["response"]))
+                events.put(("result", data))
+                return
+
+            async with self.limiter.slot():
+                events.put(("admitted", None))
+                stream = await self.async_client.chat.completions.create(
+                    model=self.model, messages=messages, temperature=0.2, stream=True)
+                streamer = _JsonFieldStreamer("response")
+                parts = []
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    parts.append(delta)
+                    token = streamer.feed(delta)
+                    if token:
+                        events.put(("token", token))
+
+            text = "".join(parts) or "{}"
+            data = self._complete_response(self._parse_reply(text, cache_key), message)
+            if not streamer.found:
+                # El modelo no respondió JSON: el texto completo es la respuesta
+                events.put(("token", data["response"]))
+            events.put(("result", data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            events.put(("error", e))
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.services.result_cache import ResultCache
+
+
+def _number(value) -> float:
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def budget_fingerprint(items: List[Dict]) -> str:
+    """
+    Hash del contenido de las líneas (código, nombre, cantidad, precio y total normalizados,
+    sin importar el orden): dos presupuestos con las mismas líneas comparten resumen
+    """
+    lines = sorted(
+        [
+            str(item.get('codigo') or '').strip(),
+            ' '.join(str(item.get('nombre') or '').lower().split()),
+            _number(item.get('cantidad')),
+            _number(item.get('precio_unitario')),
+            _number(item.get('total')),
+        ]
+        for item in items
+    )
+    return hashlib.sha256(json.dumps(lines, ensure_ascii=False).encode('utf-8')).hexdigest()[:32]
+
+
+class BudgetSummaryService:
+    """
+    Resúmenes de presupuestos cacheados por el hash de sus líneas y generados en segundo plano.
+    request() devuelve enseguida (con el resumen si ya estaba, o si se generó dentro de
+    INLINE_WAIT); si no, se consulta después con get()/wait() usando el id del resumen.
+    Un mismo contenido se genera una sola vez aunque se pida varias veces a la vez.
+    """
+
+    WORKERS = int(os.getenv("BUDGET_SUMMARY_WORKERS", "4"))
+    INLINE_WAIT = float(os.getenv("BUDGET_SUMMARY_INLINE_WAIT", "0.05"))
+    CACHE_BYTES = int(os.getenv("BUDGET_SUMMARY_CACHE_BYTES", str(2 * 1024 * 1024)))
+    CACHE_TTL = float(os.getenv("BUDGET_SUMMARY_CACHE_TTL", "86400"))
+    MAX_FAILED = 256
+
+    def __init__(self, generate: Callable[[List[Dict]], Dict], version: str = ''):
+        self.generate = generate
+        # Identifica al generador (modelo/prompt): un cambio invalida los resúmenes cacheados
+        self.version = version
+        self.cache = ResultCache(self.CACHE_BYTES, self.CACHE_TTL)
+        self._executor = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix='budget-summary')
+        self._pending: Dict[str, Future] = {}
+        self._failed: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'cache_hits': 0,
+            'generated': 0,
+            'coalesced': 0,
+            'failed': 0,
+        }
+
+    def request(self, items: List[Dict]) -> Tuple[str, Dict]:
+        """(id del resumen, {status, summary} como get(), tomados juntos)"""
+        summary_id = budget_fingerprint(items)
+        with self._lock:
+            self.stats['requests'] += 1
+        summary = self.cache.get(summary_id, self.version)
+        if summary is not None:
+            with self._lock:
+                self.stats['cache_hits'] += 1
+            return summary_id, {'status': 'ready', 'summary': summary}
+
+        with self._lock:
+            # _generate pudo haber terminado entre la consulta anterior y el lock: se vuelve a
+            # mirar el cache bajo el lock para no lanzar una segunda generación
+            summary = self.cache.get(summary_id, self.version)
+            if summary is not None:
+                self.stats['cache_hits'] += 1
+                return summary_id, {'status': 'ready', 'summary': summary}
+            future = self._pending.get(summary_id)
+            if future is None:
+                # Un pedido nuevo reintenta los que fallaron
+                self._failed.pop(summary_id, None)
+                future = self._executor.submit(self._generate, summary_id, list(items))
+                self._pending[summary_id] = future
+            else:
+                self.stats['coalesced'] += 1
+        self.wait(summary_id, self.INLINE_WAIT)
+        return summary_id, self.get(summary_id)
+
+    def _generate(self, summary_id: str, items: List[Dict]) -> Optional[Dict]:
+        try:
+            summary = self.generate(items)
+        except Exception:
+            summary = None
+        with self._lock:
+            self._pending.pop(summary_id, None)
+            # Los generadores devuelven un resumen vacío si falló el modelo: eso no se cachea
+            if summary and summary.get('summary'):
+                self.stats['generated'] += 1
+                self.cache.set(summary_id, self.version, summary)
+            else:
+                self.stats['failed'] += 1
+                self._failed[summary_id] = summary or {}
+                while len(self._failed) > self.MAX_FAILED:
+                    self._failed.popitem(last=False)
+        return summary
+
+    def get(self, summary_id: str) -> Dict:
+        """{status: ready | pending | failed | unknown, summary}"""
+        # Bajo el lock: _generate saca el pendiente y guarda el resumen en un solo paso
+        with self._lock:
+            summary = self.cache.get(summary_id, self.version)
+            if summary is not None:
+                return {'status': 'ready', 'summary': summary}
+            if summary_id in self._pending:
+                return {'status': 'pending', 'summary': None}
+            if summary_id in self._failed:
+                return {'status': 'failed', 'summary': self._failed[summary_id] or None}
+        return {'status': 'unknown', 'summary': None}
+
+    def wait(self, summary_id: str, timeout: float) -> Optional[Dict]:
+        """Resumen una vez generado, esperando a lo sumo timeout segundos (None si no está)"""
+        with self._lock:
+            future = self._pending.get(summary_id)
+        if future is not None and timeout > 0:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.cache.get(summary_id, self.version)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics['pending'] = len(self._pending)
+        metrics['cache'] = self.cache.get_metrics()
+        return metrics
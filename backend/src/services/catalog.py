@@ -0,0 +1,381 @@
+import math
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.services.search_index import PrefixIndex, TrigramIndex
+
+
+class CatalogBuilder:
+    """Acumula artículos de la operación 3 y construye un CompactCatalog"""
+
+    def __init__(self):
+        self.codigos: List[str] = []
+        self.nombres: List[str] = []
+        self.codigosint: List[str] = []
+        self.row_by_codigo: Dict[str, int] = {}
+        self.lista_codigos: List[str] = []
+        self.lista_nombres: List[str] = []
+        self.col_by_lista: Dict[str, int] = {}
+        # Campos no estándar de algunos artículos (se guardan sólo si existen)
+        self.extras: Dict[int, Dict] = {}
+        # Precios cuyo texto original no coincide con el formato de 3 decimales (fila -> columna -> texto)
+        self.precio_textos: Dict[int, Dict[int, str]] = {}
+        # Precios en formato coordenado (fila, columna, valor) hasta armar la matriz
+        self._rows = array('q')
+        self._cols = array('q')
+        self._values = array('d')
+
+    def add(self, articulo: Dict):
+        codigo = sys.intern(str(articulo.get('codigo') or ''))
+        if codigo in self.row_by_codigo:
+            # Ante códigos duplicados se conserva el primero, como la búsqueda lineal original
+            return
+        row = len(self.codigos)
+        self.row_by_codigo[codigo] = row
+        self.codigos.append(codigo)
+        self.nombres.append(articulo.get('nombre') or '')
+        self.codigosint.append(sys.intern(str(articulo.get('codigoint') or '')))
+
+        extra = {k: v for k, v in articulo.items() if k not in ('codigo', 'nombre', 'codigoint', 'precios')}
+        if extra:
+            self.extras[row] = extra
+
+        seen = set()
+        for precio in articulo.get('precios') or []:
+            lista = sys.intern(str(precio.get('codigo') or ''))
+            if lista in seen:
+                continue
+            texto = precio.get('precio', '0')
+            try:
+                value = float(texto)
+            except (TypeError, ValueError):
+                continue
+            if not math.isfinite(value):
+                # "inf"/"nan" pasan float() pero no son un precio
+                continue
+            seen.add(lista)
+            col = self.col_by_lista.get(lista)
+            if col is None:
+                col = self.col_by_lista[lista] = len(self.lista_codigos)
+                self.lista_codigos.append(lista)
+                self.lista_nombres.append(precio.get('nombre') or '')
+            if texto != f"{value:.3f}":
+                self.precio_textos.setdefault(row, {})[col] = texto
+            self._rows.append(row)
+            self._cols.append(col)
+            self._values.append(value)
+
+    def build(self, extra_payload: Optional[Dict] = None,
+              previous: Optional['CompactCatalog'] = None) -> 'CompactCatalog':
+        precios = np.full((len(self.codigos), len(self.lista_codigos)), np.nan, dtype=np.float64)
+        if self._values:
+            precios[np.frombuffer(self._rows, dtype=np.int64), np.frombuffer(self._cols, dtype=np.int64)] = \
+                np.frombuffer(self._values, dtype=np.float64)
+        return CompactCatalog(
+            codigos=self.codigos,
+            nombres=self.nombres,
+            codigosint=self.codigosint,
+            lista_codigos=self.lista_codigos,
+            lista_nombres=self.lista_nombres,
+            precios=precios,
+            extras=self.extras,
+            precio_textos=self.precio_textos,
+            extra_payload=extra_payload,
+            previous=previous,
+        )
+
+
+class CatalogChanges:
+    """Diferencias entre dos versiones consecutivas del catálogo"""
+
+    def __init__(self, added: List[Dict], removed: List[str], renamed: List[Dict], repriced: List[Dict],
+                 updated: Optional[List[Dict]] = None, listas: Optional[List[Dict]] = None):
+        self.added = added
+        self.removed = removed
+        self.renamed = renamed
+        self.repriced = repriced
+        # Artículos con otro codigoint o con otros campos no estándar
+        self.updated = updated or []
+        # Listas de precios nuevas o con otro nombre
+        self.listas = listas or []
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.renamed or self.repriced or self.updated or self.listas)
+
+    def to_dict(self) -> Dict:
+        return {
+            'added': self.added,
+            'removed': self.removed,
+            'renamed': self.renamed,
+            'repriced': self.repriced,
+            'updated': self.updated,
+            'listas': self.listas,
+        }
+
+
+class CompactCatalog:
+    """
+    Catálogo de artículos (operación 3) en formato columnar: códigos internados,
+    columnas por campo y una matriz densa de precios (artículos x listas) parseada una sola vez.
+    Los artículos se materializan como dicts sólo al devolverlos.
+    Si se pasa la versión anterior, se calculan los cambios y el índice de búsqueda
+    se actualiza incrementalmente en lugar de reconstruirse.
+    """
+
+    # Fracción de documentos eliminados a partir de la cual el índice se reconstruye completo
+    MAX_INDEX_DEAD_RATIO = 0.25
+
+    def __init__(self, codigos: List[str], nombres: List[str], codigosint: List[str],
+                 lista_codigos: List[str], lista_nombres: List[str], precios: np.ndarray,
+                 extras: Optional[Dict[int, Dict]] = None, extra_payload: Optional[Dict] = None,
+                 previous: Optional['CompactCatalog'] = None,
+                 precio_textos: Optional[Dict[int, Dict[int, str]]] = None):
+        self.codigos = codigos
+        self.nombres = nombres
+        self.codigosint = codigosint
+        self.lista_codigos = lista_codigos
+        self.lista_nombres = lista_nombres
+        self.precios = precios
+        self.extras = extras or {}
+        # Texto original de los precios que no vienen con 3 decimales, para devolverlos tal cual
+        self.precio_textos = precio_textos or {}
+        # Claves de primer nivel de la respuesta distintas de 'articulos' (p. ej. 'resultado')
+        self.extra_payload = extra_payload or {'resultado': 1}
+        self.row_by_codigo = {codigo: row for row, codigo in enumerate(codigos)}
+        self.col_by_lista = {lista: col for col, lista in enumerate(lista_codigos)}
+        # Versión asignada por quien publica el catálogo (ver HDLApiService)
+        self.version = 0
+        self.changes: Optional[CatalogChanges] = None
+        if previous is not None:
+            self.changes = self._diff(previous)
+        # Índice de búsqueda por nombre/código, construido (o parchado) junto con el snapshot
+        self.search_index = self._build_search_index(previous)
+        # Índice de autocompletado: también se arma con el snapshot (en el hilo que lo refresca)
+        # y se hereda si sólo cambiaron precios o campos que no indexa
+        if previous is not None and self.search_index is previous.search_index \
+                and not any(item['codigoint'] != previous.codigosint[previous.row_by_codigo[item['codigo']]]
+                            for item in self.changes.updated):
+            self.autocomplete_index = previous.autocomplete_index
+        else:
+            self.autocomplete_index = self._build_autocomplete_index()
+
+    def _build_search_index(self, previous: Optional['CompactCatalog']) -> TrigramIndex:
+        if previous is None or previous.search_index.dead_ratio > self.MAX_INDEX_DEAD_RATIO:
+            return TrigramIndex(zip(self.codigos, self.nombres, self.codigos))
+        changes = self.changes
+        if not (changes.added or changes.removed or changes.renamed):
+            # Sólo cambiaron precios: el índice anterior sirve tal cual
+            return previous.search_index
+        reindexed = [item['codigo'] for item in changes.added + changes.renamed]
+        return previous.search_index.patched(
+            changes.removed + [item['codigo'] for item in changes.renamed],
+            ((codigo, self.nombres[self.row_by_codigo[codigo]], codigo) for codigo in reindexed),
+        )
+
+    def _build_autocomplete_index(self) -> PrefixIndex:
+        # Se reutilizan los nombres ya normalizados por el índice de búsqueda
+        index = self.search_index
+        return PrefixIndex(
+            (
+                (codigo, index.normalized[index.id_by_key[codigo]], (codigo, codigoint))
+                for codigo, codigoint in zip(self.codigos, self.codigosint)
+            ),
+            normalized=True,
+        )
+
+    def autocomplete(self, query: str, limit: int = 8) -> List[Dict]:
+        """Sugerencias livianas (código y nombre) para autocompletar mientras se escribe"""
+        return [
+            {'codigo': codigo, 'nombre': self.nombres[self.row_by_codigo[codigo]]}
+            for codigo in self.autocomplete_index.complete(query, limit)
+        ]
+
+    def _price_block(self, rows: np.ndarray, listas: List[str]) -> np.ndarray:
+        """Submatriz de precios de las filas dadas, con columnas en el orden de listas"""
+        block = np.full((len(rows), len(listas)), np.nan, dtype=np.float64)
+        for j, lista in enumerate(listas):
+            col = self.col_by_lista.get(lista)
+            if col is not None:
+                block[:, j] = self.precios[rows, col]
+        return block
+
+    def _diff(self, previous: 'CompactCatalog') -> CatalogChanges:
+        """Compara con la versión anterior por código de artículo y código de lista"""
+        added = []
+        common = []
+        for codigo in self.codigos:
+            if codigo in previous.row_by_codigo:
+                common.append(codigo)
+            else:
+                added.append({'codigo': codigo, 'nombre': self.nombres[self.row_by_codigo[codigo]]})
+        removed = [codigo for codigo in previous.codigos if codigo not in self.row_by_codigo]
+
+        new_rows = self.rows_for(common)
+        old_rows = previous.rows_for(common)
+        renamed = [
+            {'codigo': codigo, 'nombre': self.nombres[new_row]}
+            for codigo, new_row, old_row in zip(common, new_rows.tolist(), old_rows.tolist())
+            if self.nombres[new_row] != previous.nombres[old_row]
+        ]
+        updated = [
+            {'codigo': codigo, 'codigoint': self.codigosint[new_row], 'extras': self.extras.get(new_row, {})}
+            for codigo, new_row, old_row in zip(common, new_rows.tolist(), old_rows.tolist())
+            if self.codigosint[new_row] != previous.codigosint[old_row]
+            or self.extras.get(new_row, {}) != previous.extras.get(old_row, {})
+        ]
+        nombres_anteriores = dict(zip(previous.lista_codigos, previous.lista_nombres))
+        listas_cambiadas = [
+            {'codigo': lista, 'nombre': nombre}
+            for lista, nombre in zip(self.lista_codigos, self.lista_nombres)
+            if nombres_anteriores.get(lista) != nombre
+        ]
+
+        listas = list(dict.fromkeys(self.lista_codigos + previous.lista_codigos))
+        nuevos = self._price_block(new_rows, listas)
+        anteriores = previous._price_block(old_rows, listas)
+        changed = ~((nuevos == anteriores) | (np.isnan(nuevos) & np.isnan(anteriores)))
+        repriced = []
+        for i in np.flatnonzero(changed.any(axis=1)).tolist():
+            precios = []
+            for j in np.flatnonzero(changed[i]).tolist():
+                anterior, nuevo = anteriores[i, j], nuevos[i, j]
+                precios.append({
+                    'lista': listas[j],
+                    'anterior': None if np.isnan(anterior) else float(anterior),
+                    'nuevo': None if np.isnan(nuevo) else float(nuevo),
+                })
+            repriced.append({'codigo': common[i], 'precios': precios})
+
+        return CatalogChanges(added, removed, renamed, repriced, updated, listas_cambiadas)
+
+    @classmethod
+    def from_articulos(cls, articulos: Iterable[Dict], extra_payload: Optional[Dict] = None,
+                       previous: Optional['CompactCatalog'] = None) -> 'CompactCatalog':
+        builder = CatalogBuilder()
+        for articulo in articulos:
+            builder.add(articulo)
+        return builder.build(extra_payload, previous)
+
+    @classmethod
+    def from_payload(cls, data: Dict, previous: Optional['CompactCatalog'] = None) -> 'CompactCatalog':
+        extra_payload = {k: v for k, v in data.items() if k != 'articulos'}
+        return cls.from_articulos(data.get('articulos', []), extra_payload, previous)
+
+    def to_columns(self) -> Dict:
+        """Columnas del catálogo (sin la matriz de precios), serializables como JSON"""
+        return {
+            'version': self.version,
+            'codigos': self.codigos,
+            'nombres': self.nombres,
+            'codigosint': self.codigosint,
+            'lista_codigos': self.lista_codigos,
+            'lista_nombres': self.lista_nombres,
+            'extras': {str(row): extra for row, extra in self.extras.items()},
+            'precio_textos': {str(row): {str(col): texto for col, texto in textos.items()}
+                              for row, textos in self.precio_textos.items()},
+            'extra_payload': self.extra_payload,
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict, precios: np.ndarray,
+                     previous: Optional['CompactCatalog'] = None) -> 'CompactCatalog':
+        """Reconstruye un catálogo guardado con to_columns(); precios puede ser un memmap de solo lectura"""
+        catalogo = cls(
+            codigos=[sys.intern(codigo) for codigo in columns['codigos']],
+            nombres=columns['nombres'],
+            codigosint=[sys.intern(codigo) for codigo in columns['codigosint']],
+            lista_codigos=[sys.intern(lista) for lista in columns['lista_codigos']],
+            lista_nombres=columns['lista_nombres'],
+            precios=precios,
+            extras={int(row): extra for row, extra in columns.get('extras', {}).items()},
+            extra_payload=columns.get('extra_payload'),
+            previous=previous,
+            precio_textos={int(row): {int(col): texto for col, texto in textos.items()}
+                           for row, textos in columns.get('precio_textos', {}).items()},
+        )
+        catalogo.version = columns.get('version', 0)
+        return catalogo
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.precios.nbytes)
+
+    def get_row(self, codigo: str) -> Optional[int]:
+        return self.row_by_codigo.get(codigo)
+
+    def to_dict(self, row: int) -> Dict:
+        """Materializa un artículo con el mismo formato que devuelve la API de HDL"""
+        precios = []
+        textos = self.precio_textos.get(row, {})
+        for col in np.flatnonzero(~np.isnan(self.precios[row])).tolist():
+            precios.append({
+                'codigo': self.lista_codigos[col],
+                'nombre': self.lista_nombres[col],
+                'precio': textos[col] if col in textos else f"{self.precios[row, col]:.3f}",
+            })
+        articulo = {
+            'codigo': self.codigos[row],
+            'nombre': self.nombres[row],
+            'codigoint': self.codigosint[row],
+        }
+        articulo.update(self.extras.get(row, {}))
+        articulo['precios'] = precios
+        return articulo
+
+    def search(self, query: str, limit: int = 50, fuzzy: bool = False) -> List[Dict]:
+        """Artículos que coinciden con la consulta, ordenados por relevancia"""
+        if not query.strip():
+            return [self.to_dict(row) for row in range(min(limit, len(self)))]
+        matches = self.search_index.search(query, limit, fuzzy=fuzzy)
+        return [self.to_dict(self.row_by_codigo[codigo]) for codigo, _ in matches]
+
+    def rank(self, query: str, fuzzy: bool = False) -> List[str]:
+        """Códigos de todos los artículos que coinciden, en el orden de search()"""
+        if not query.strip():
+            return list(self.codigos)
+        return [codigo for codigo, _ in self.search_index.search(query, fuzzy=fuzzy)]
+
+    def to_payload(self) -> Dict:
+        payload = dict(self.extra_payload)
+        payload['articulos'] = [self.to_dict(row) for row in range(len(self))]
+        return payload
+
+    def get_articulo(self, codigo: str) -> Optional[Dict]:
+        row = self.get_row(codigo)
+        return self.to_dict(row) if row is not None else None
+
+    def get_precio(self, codigo_articulo: str, codigo_lista: str) -> Optional[float]:
+        row = self.get_row(codigo_articulo)
+        col = self.col_by_lista.get(codigo_lista)
+        if row is None or col is None:
+            return None
+        value = self.precios[row, col]
+        return None if np.isnan(value) else float(value)
+
+    def rows_for(self, codigos: Iterable[str]) -> np.ndarray:
+        """Filas de los códigos pedidos (-1 si el artículo no existe)"""
+        return np.fromiter((self.row_by_codigo.get(codigo, -1) for codigo in codigos), dtype=np.int_)
+
+    def precios_matrix(self, rows: np.ndarray, listas: List[str]) -> np.ndarray:
+        """Precios de varias filas en varias listas (filas x listas); NaN si no hay precio"""
+        block = np.full((len(rows), len(listas)), np.nan, dtype=np.float64)
+        cols = np.fromiter((self.col_by_lista.get(lista, -1) for lista in listas), dtype=np.int_, count=len(listas))
+        found = rows >= 0
+        known = cols >= 0
+        block[np.ix_(found, known)] = self.precios[np.ix_(rows[found], cols[known])]
+        return block
+
+    def precios_for(self, rows: np.ndarray, codigo_lista: str) -> np.ndarray:
+        """Precios vectorizados de varias filas en una lista (NaN si no hay precio)"""
+        result = np.full(len(rows), np.nan, dtype=np.float64)
+        col = self.col_by_lista.get(codigo_lista)
+        found = rows >= 0
+        if col is not None:
+            result[found] = self.precios[rows[found], col]
+        return result
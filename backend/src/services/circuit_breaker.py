@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de fallas sobre una ventana de las últimas llamadas.
+    - closed: las llamadas pasan; si la tasa de fallas supera el umbral (con un mínimo
+      de llamadas en la ventana) se abre.
+    - open: las llamadas se rechazan de inmediato durante open_seconds.
+    - half_open: pasa una única llamada de prueba; si funciona se cierra, si falla se reabre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._results = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'rejected': 0,
+            'opened': 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """True si la llamada puede ir al upstream (en half_open, sólo la primera)"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.stats['successes'] += 1
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._results.clear()
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self.stats['failures'] += 1
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._results.append(False)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        """
+        Libera la prueba de half_open sin registrar resultado (llamada que no llegó al upstream
+        o que se cortó por el presupuesto del request)
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._results.clear()
+        self.stats['opened'] += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._results)
+            failures = self._results.count(False)
+            metrics = dict(self.stats)
+            metrics.update({
+                'state': state,
+                'window_calls': calls,
+                'failure_rate': round(failures / calls, 4) if calls else 0.0,
+                'retry_in': round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 3)
+                if state == self.OPEN else 0.0,
+            })
+        return metrics
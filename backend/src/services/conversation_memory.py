@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from src.services.result_cache import ResultCache
+
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+# Datos de la conversación: el valor tiene que empezar con mayúscula o número (nombre o código)
+_FACT_RES = (
+    ('cliente', re.compile(r"\b(?i:cliente)\s*(?::|=|es\b)?\s*([A-ZÁÉÍÓÚÑ0-9][^\n,;.?!]{1,58})")),
+    ('obra', re.compile(r"\b(?i:obra)\s*(?::|=|es\b|n[°º]?)?\s*([A-ZÁÉÍÓÚÑ0-9][^\n,;.?!]{1,58})")),
+    ('lista', re.compile(r"\b(?i:lista(?: de precios)?)\s*(?::|=|es\b)?\s*([A-ZÁÉÍÓÚÑ0-9][^\n,;.?!]{0,38})")),
+)
+# Pedidos con cantidad: "10 bolsas de cemento", "3 m3 de arena"
+_ORDER_RE = re.compile(r"\b(\d+(?:[.,]\d+)?\s*(?:x\s*)?[a-záéíóúñ][^\n,;.?!]{2,50})", re.IGNORECASE)
+
+SUMMARY_VERSION = 1
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con tiktoken (el tokenizador del modelo) si está instalado; si no, con una
+    aproximación local (una palabra cada 4 caracteres, cada signo un token).
+    tiktoken se carga en segundo plano en el primer uso, nunca al importar: la primera vez
+    puede descargar sus tablas (salvo que TIKTOKEN_CACHE_DIR apunte a una copia local) y
+    mientras tanto, o si falla, se usa la aproximación.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._load_started = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            import tiktoken
+            try:
+                encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # Sin tiktoken (o sin sus tablas): se sigue usando la aproximación
+            return
+        self._encoding = encoding
+
+    def _get_encoding(self):
+        if self._encoding is None and not self._load_started:
+            with self._lock:
+                if not self._load_started:
+                    self._load_started = True
+                    threading.Thread(target=self._load, name="tiktoken-load", daemon=True).start()
+        return self._encoding
+
+    @property
+    def name(self) -> str:
+        return self._encoding.name if self._encoding is not None else 'heuristic'
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return sum(1 + (len(word) - 1) // 4 for word in _WORD_RE.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Prefijo de text de a lo sumo max_tokens tokens"""
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+        used = 0
+        for match in _WORD_RE.finditer(text):
+            used += 1 + (len(match.group()) - 1) // 4
+            if used > max_tokens:
+                return text[:match.start()].rstrip()
+        return text
+
+
+def _empty_summary() -> Dict:
+    return {'turns': 0, 'facts': {}, 'orders': [], 'notes': []}
+
+
+def _extend_summary(summary: Dict, turns: List[Dict]) -> Dict:
+    """Resumen que agrega turns al resumen dado (sin modificarlo)"""
+    facts = dict(summary['facts'])
+    orders = OrderedDict((order, None) for order in summary['orders'])
+    notes = list(summary['notes'])
+    for turn in turns:
+        if turn['role'] != 'user':
+            continue
+        content = turn['content']
+        for name, pattern in _FACT_RES:
+            found = pattern.findall(content) if name in content.lower() else []
+            if found:
+                # El último dato mencionado reemplaza al anterior
+                facts[name] = found[-1].strip()
+        for order in _ORDER_RE.findall(content):
+            order = ' '.join(order.split())
+            orders.pop(order, None)
+            orders[order] = None
+        notes.append(' '.join(content.split())[:200])
+    return {
+        'turns': summary['turns'] + len(turns),
+        'facts': facts,
+        'orders': list(orders)[-30:],
+        'notes': notes[-3:],
+    }
+
+
+class ConversationMemory:
+    """
+    Arma el historial para el modelo dentro de un presupuesto de tokens: entran los turnos
+    más recientes que quepan (cada uno con un tope) y los anteriores se compactan en un
+    resumen (cliente, obra, lista, pedidos y últimos mensajes) de tamaño acotado.
+
+    El resumen se cachea por prefijo de la conversación (hash encadenado de sus turnos): en
+    cada turno nuevo se parte del resumen del prefijo más largo ya calculado y sólo se
+    procesan los turnos que salieron de la ventana.
+    """
+
+    HISTORY_TOKENS = int(os.getenv("AI_HISTORY_TOKENS", "1500"))
+    TURN_TOKENS = int(os.getenv("AI_TURN_TOKENS", "500"))
+    SUMMARY_TOKENS = int(os.getenv("AI_SUMMARY_TOKENS", "300"))
+    SUMMARY_CACHE_BYTES = int(os.getenv("AI_SUMMARY_CACHE_BYTES", str(4 * 1024 * 1024)))
+    SUMMARY_CACHE_TTL = float(os.getenv("AI_SUMMARY_CACHE_TTL", "86400"))
+
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self.cache = ResultCache(self.SUMMARY_CACHE_BYTES, self.SUMMARY_CACHE_TTL)
+        self._lock = threading.Lock()
+        self.stats = {
+            'turns_summarized': 0,
+            'summaries_extended': 0,
+            'last_history_tokens': 0,
+        }
+
+    def build(self, conversation_history: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """
+        Mensajes de historial (resumen como mensaje de sistema + ventana reciente) y los datos
+        de la conversación (cliente, obra, lista) mencionados hasta ahora
+        """
+        turns = []
+        for turn in conversation_history:
+            role = "user" if turn.get("role") == "user" else "assistant"
+            content = str(turn.get("content", ""))
+            if content:
+                turns.append({"role": role, "content": content})
+
+        # Ventana: turnos más recientes que entran en el presupuesto (el último siempre entra)
+        window, used = [], 0
+        for turn in reversed(turns):
+            content = self.counter.truncate(turn["content"], self.TURN_TOKENS)
+            tokens = self.counter.count(content)
+            if window and used + tokens > self.HISTORY_TOKENS:
+                break
+            window.append({"role": turn["role"], "content": content})
+            used += tokens
+        window.reverse()
+
+        cutoff = len(turns) - len(window)
+        messages, summary = window, _empty_summary()
+        if cutoff:
+            summary = self._summary(turns, cutoff)
+            messages = [{"role": "system", "content": summary['text']}] + window
+            used += self.counter.count(summary['text'])
+        with self._lock:
+            self.stats['last_history_tokens'] = used
+        # Los datos más recientes pueden estar en la ventana
+        facts = _extend_summary(summary, turns[cutoff:])['facts']
+        return messages, facts
+
+    def _summary(self, turns: List[Dict], cutoff: int) -> Dict:
+        """Resumen (con su texto) de turns[:cutoff], extendiendo el del prefijo cacheado más largo"""
+        hashes = []
+        digest = b''
+        for turn in turns[:cutoff]:
+            digest = hashlib.sha1(digest + turn["role"].encode() + b'\0' + turn["content"].encode('utf-8')).digest()
+            hashes.append(digest.hex())
+
+        summary, start = _empty_summary(), 0
+        for index in range(cutoff - 1, -1, -1):
+            cached = self.cache.get(hashes[index], SUMMARY_VERSION)
+            if cached is not None:
+                summary, start = cached, index + 1
+                break
+        if start == cutoff:
+            return summary
+
+        summary = _extend_summary(summary, turns[start:cutoff])
+        summary['text'] = self._render(summary)
+        self.cache.set(hashes[cutoff - 1], SUMMARY_VERSION, summary)
+        with self._lock:
+            self.stats['turns_summarized'] += cutoff - start
+            self.stats['summaries_extended'] += 1
+        return summary
+
+    def _render(self, summary: Dict) -> str:
+        """
+        Texto del resumen dentro de SUMMARY_TOKENS: los datos siempre entran, luego los pedidos
+        más recientes que quepan (reservando hasta un tercio para los últimos mensajes)
+        """
+        parts = [f"Resumen de los {summary['turns']} mensajes anteriores de la conversación."]
+        for name in ('cliente', 'obra', 'lista'):
+            if summary['facts'].get(name):
+                parts.append(f"{name.capitalize()}: {summary['facts'][name]}.")
+        notes = ""
+        if summary['notes']:
+            notes = "Últimos mensajes del usuario: " + " | ".join(summary['notes'])
+
+        available = self.SUMMARY_TOKENS - self.counter.count(" ".join(parts))
+        available -= min(self.counter.count(notes), self.SUMMARY_TOKENS // 3)
+        orders = []
+        for order in reversed(summary['orders']):
+            cost = self.counter.count(order) + 1
+            if cost > available:
+                break
+            orders.append(order)
+            available -= cost
+        if orders:
+            parts.append("Pedidos mencionados: " + "; ".join(reversed(orders)) + ".")
+        if notes:
+            parts.append(notes)
+        return self.counter.truncate(" ".join(parts), self.SUMMARY_TOKENS)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.stats)
+        metrics.update({
+            'tokenizer': self.counter.name,
+            'history_budget': self.HISTORY_TOKENS,
+            'summary_budget': self.SUMMARY_TOKENS,
+            'summary_cache': self.cache.get_metrics(),
+        })
+        return metrics
@@ -1,85 +1,731 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from typing import Dict, List, Optional
 import time
 import os
+import threading
+import random
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
 from src.services.mock_data import MOCK_SOCIEDADES, MOCK_CLIENTES_OBRAS, MOCK_ARTICULOS
+from src.services.hdl_indexes import ClientesIndex
+from src.services.catalog import CatalogBuilder, CompactCatalog
+from src.services.json_stream import iter_json_array
+from src.services.result_cache import ResultCache
+from src.services.search_index import normalize
+from src.services.pagination import decode_cursor, paginate, query_fingerprint
+from src.services.circuit_breaker import CircuitBreaker
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+# Instante límite (time.monotonic) del request entrante; None fuera de un request (p. ej. scheduler)
+_request_deadline: ContextVar[Optional[float]] = ContextVar('hdl_request_deadline', default=None)
+
+
+def set_request_deadline(budget: Optional[float]):
+    """
+    Fija el presupuesto de tiempo (segundos) del request actual: las llamadas a HDL que
+    haga este hilo no esperan más allá (None = sin límite; 0 = sólo datos ya en memoria).
+    Devuelve el token para reset_request_deadline().
+    """
+    return _request_deadline.set(None if budget is None else time.monotonic() + max(0.0, budget))
+
+
+def reset_request_deadline(token):
+    _request_deadline.reset(token)
+
+
+def _remaining_budget() -> Optional[float]:
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def get_hdl_service() -> 'HDLApiService':
+    """
+    Instancia única del servicio HDL por proceso (rutas y servicios de IA comparten
+    cache, índices y catálogo). La primera llamada inicia el scheduler de refresco
+    salvo que HDL_REFRESH_SCHEDULER=false.
+    """
+    global _shared_service
+    with _shared_service_lock:
+        if _shared_service is None:
+            _shared_service = HDLApiService()
+            if os.getenv('HDL_REFRESH_SCHEDULER', 'true').lower() == 'true':
+                _shared_service.start_refresh_scheduler()
+        return _shared_service
 
 class HDLApiService:
     """Servicio para integrar con las APIs de HDL Zomatik"""
     
     BASE_URL = os.getenv("HDL_API_BASE", "https://hdl.zomatik.com/ws_web.php")
+    # Directorio donde se guardan los snapshots de cada operación entre reinicios
+    CACHE_DIR = os.getenv("HDL_CACHE_DIR", "/tmp/hdl_cache")
+    OPERACIONES = (1, 2, 3)
+    # Índices que se reconstruyen con cada snapshot de la operación
+    INDEX_BUILDERS = {1: ClientesIndex}
+    # Fracción del TTL tras la cual el scheduler refresca, y jitter relativo aplicado al intervalo
+    REFRESH_AHEAD = 0.8
+    REFRESH_JITTER = 0.1
+    # Cantidad de versiones del catálogo cuyos cambios se conservan para el feed
+    CATALOG_CHANGES_HISTORY = int(os.getenv('HDL_CATALOG_CHANGES_HISTORY', '50'))
+    # Fracción máxima del catálogo anterior que puede desaparecer en un refresh (1 lo desactiva)
+    CATALOG_MAX_REMOVED_RATIO = float(os.getenv('HDL_CATALOG_MAX_REMOVED_RATIO', '0.5'))
+    # Tamaño de cada lectura al recibir el catálogo en streaming
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # Timeouts (segundos) de conexión y de lectura hacia el web service
+    CONNECT_TIMEOUT = float(os.getenv('HDL_CONNECT_TIMEOUT', '5'))
+    READ_TIMEOUT = float(os.getenv('HDL_READ_TIMEOUT', '30'))
+    # Tiempo mínimo (segundos) que debe quedar del presupuesto del request para llamar a HDL
+    MIN_CALL_BUDGET = 0.05
+    # Intervalo (segundos) entre intentos de tomar el lock del host dentro de un request
+    HOST_LOCK_POLL = 0.05
+    # Cache de resultados de búsqueda: tope en bytes y vigencia (segundos); 0 lo desactiva
+    SEARCH_CACHE_BYTES = int(os.getenv('HDL_SEARCH_CACHE_BYTES', str(8 * 1024 * 1024)))
+    SEARCH_CACHE_TTL = float(os.getenv('HDL_SEARCH_CACHE_TTL', '300'))
+    # Alícuota de IVA aplicada a los presupuestos
+    IVA_RATE = 0.21
+    # Lista principal de cada operación: una respuesta sin elementos no reemplaza al snapshot
+    PAYLOAD_LISTS = {1: 'clientes', 2: 'sociedades', 3: 'articulos'}
     
     def __init__(self):
         self.cache = {}
+        self.indexes = {}
+        self.catalog_changes = deque(maxlen=self.CATALOG_CHANGES_HISTORY)
+        # ETag / Last-Modified de la última respuesta de cada operación (para GET condicionales)
+        self.validators: Dict[int, Dict[str, str]] = {}
+        # mtime del snapshot en disco que refleja el cache de cada operación (para detectar
+        # snapshots más nuevos escritos por otro worker del mismo host)
+        self._snapshot_mtimes: Dict[int, float] = {}
+        self.search_cache = ResultCache(self.SEARCH_CACHE_BYTES, self.SEARCH_CACHE_TTL)
+        # Con el circuito abierto no se llama a HDL y se sirve el último snapshot bueno
+        self.breaker = CircuitBreaker(
+            failure_rate=float(os.getenv('HDL_BREAKER_FAILURE_RATE', '0.5')),
+            window=int(os.getenv('HDL_BREAKER_WINDOW', '20')),
+            min_calls=int(os.getenv('HDL_BREAKER_MIN_CALLS', '5')),
+            open_seconds=float(os.getenv('HDL_BREAKER_OPEN_SECONDS', '30')),
+        )
+        self.session = self._create_session()
         self.cache_ttl = 300  # 5 minutos
+        # TTL por operación (segundos); el catálogo (3) cambia con menos frecuencia que los clientes (1)
+        self.cache_ttls = {
+            operacion: int(os.getenv(f'HDL_TTL_OPERACION_{operacion}', str(self.cache_ttl)))
+            for operacion in self.OPERACIONES
+        }
         # Desactivar mocks por defecto. Activar explícitamente con USE_MOCK_DATA=true si se desea.
         self.use_mock = os.getenv('USE_MOCK_DATA', 'false').lower() == 'true'
+        # Tiempo máximo (segundos) que un request con datos vencidos espera al refresco en curso
+        self.single_flight_wait = float(os.getenv('HDL_SINGLE_FLIGHT_WAIT', '0'))
+        self._lock = threading.Lock()
+        # Single-flight: un único fetch en curso por operación; el resto espera su resultado
+        self._inflight: Dict[int, threading.Event] = {}
+        # Datos de prueba (e índice) que se sirven a un request cuando no hay ningún dato real
+        self._mock_snapshots: Dict[int, tuple] = {}
+        self.stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'wait_timeouts': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'not_modified': 0,
+            'shared_refreshes': 0,
+            'breaker_rejections': 0,
+            'deadline_exceeded': 0,
+        }
+        self._scheduler_stop = threading.Event()
+        self._scheduler_threads: List[threading.Thread] = []
+        # Arranque en caliente: servir el último snapshot guardado mientras se refresca
+        self._load_snapshots()
+    
+    def _create_session(self) -> requests.Session:
+        """
+        Sesión HTTP con pool de conexiones keep-alive hacia HDL.
+        requests ya anuncia gzip/deflate (y br/zstd si están instalados) en Accept-Encoding
+        y descomprime la respuesta de forma transparente.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def _conditional_headers(self, operacion: int) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since si ya tenemos una versión de la operación"""
+        validators = self.validators.get(operacion, {})
+        if f"operacion_{operacion}" not in self.cache:
+            return {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+    
+    def _touch(self, operacion: int):
+        """Renueva la vigencia de la versión actual (respuesta 304 del upstream)"""
+        cache_key = f"operacion_{operacion}"
+        data, _ = self.cache[cache_key]
+        self.cache[cache_key] = (data, time.time())
+        try:
+            path = self._snapshot_path(operacion)
+            os.utime(path)
+            self._snapshot_mtimes[operacion] = os.path.getmtime(path)
+        except OSError:
+            pass
+    
+    def _get_ttl(self, key: str) -> int:
+        operacion = int(key.rsplit('_', 1)[-1])
+        return self.cache_ttls.get(operacion, self.cache_ttl)
     
     def _get_cached_data(self, key: str) -> Optional[Dict]:
         """Obtiene datos del cache si están disponibles y no han expirado"""
         if key in self.cache:
             data, timestamp = self.cache[key]
-            if time.time() - timestamp < self.cache_ttl:
+            if time.time() - timestamp < self._get_ttl(key):
                 return data
         return None
     
-    def _set_cache_data(self, key: str, data: Dict):
-        """Guarda datos en el cache"""
-        self.cache[key] = (data, time.time())
+    def _set_cache_data(self, key: str, data: Dict, timestamp: Optional[float] = None):
+        """Guarda datos en el cache y reconstruye sus índices antes de publicarlos"""
+        operacion = int(key.rsplit('_', 1)[-1])
+        if operacion == 3:
+            # El catálogo se guarda sólo en formato compacto; el payload original se descarta
+            if not isinstance(data, CompactCatalog):
+                data = CompactCatalog.from_payload(data, previous=self.indexes.get(3))
+            if data is not self.indexes.get(3):
+                self._record_catalog_changes(data)
+            self.indexes[operacion] = data
+        builder = self.INDEX_BUILDERS.get(operacion)
+        if builder is not None:
+            # El índice se construye completo y se publica con una sola asignación
+            self.indexes[operacion] = builder(data)
+        self.cache[key] = (data, timestamp if timestamp is not None else time.time())
     
-    def _make_request(self, operacion: int) -> Dict:
-        """Realiza una petición a la API de HDL o devuelve datos de prueba"""
+    def _record_catalog_changes(self, catalogo: CompactCatalog):
+        """Asigna versión al catálogo nuevo y registra sus cambios en el feed"""
+        previous = self.indexes.get(3)
+        if catalogo.version:
+            # Versión ya asignada por el worker que descargó el catálogo (snapshot compartido)
+            if previous is not None and catalogo.version > previous.version \
+                    and catalogo.changes is not None and not catalogo.changes.is_empty():
+                entry = {'version': catalogo.version, 'timestamp': time.time()}
+                entry.update(catalogo.changes.to_dict())
+                with self._lock:
+                    self.catalog_changes.append(entry)
+            return
+        if previous is None:
+            catalogo.version = 1
+            return
+        if catalogo.changes is None or catalogo.changes.is_empty():
+            catalogo.version = previous.version
+            return
+        catalogo.version = previous.version + 1
+        entry = {'version': catalogo.version, 'timestamp': time.time()}
+        entry.update(catalogo.changes.to_dict())
+        with self._lock:
+            self.catalog_changes.append(entry)
+    
+    def _get_index(self, operacion: int):
+        """Devuelve el índice vigente de una operación (aplicando la política de cache)"""
+        self._make_request(operacion)
+        index = self.indexes.get(operacion)
+        if index is None:
+            # Todavía no hay datos reales: índice de los datos de prueba servidos a este request
+            index = self._mock_snapshot(operacion)[1]
+        return index
+    
+    def _snapshot_path(self, operacion: int) -> str:
+        return os.path.join(self.CACHE_DIR, f"operacion_{operacion}.json")
+    
+    def _precios_path(self, name: str) -> str:
+        return os.path.join(self.CACHE_DIR, name)
+    
+    def _load_snapshots(self):
+        """Carga en memoria los snapshots guardados en disco (si existen)"""
+        if self.use_mock:
+            return
+        for operacion in self.OPERACIONES:
+            self._load_snapshot(operacion)
+    
+    def _load_snapshot(self, operacion: int) -> bool:
+        """Carga el snapshot de una operación. Devuelve False si no existe o es inválido"""
+        path = self._snapshot_path(operacion)
+        if not os.path.exists(path):
+            return False
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if operacion == 3 and 'catalog' in snapshot:
+                # La matriz de precios se mapea en memoria: los workers del host comparten
+                # las mismas páginas en lugar de tener una copia cada uno. Columnas e índices
+                # (la mayor parte de la memoria del catálogo) se siguen armando por worker
+                precios = np.load(self._precios_path(snapshot['precios']), mmap_mode='r')
+                data = CompactCatalog.from_columns(snapshot['catalog'], precios, previous=self.indexes.get(3))
+            else:
+                data = snapshot['data']
+            if snapshot.get('validators'):
+                self.validators[operacion] = snapshot['validators']
+            # Un 304 renueva el snapshot con utime, sin reescribirlo
+            saved_at = max(snapshot['saved_at'], mtime)
+            self._set_cache_data(f"operacion_{operacion}", data, saved_at)
+            self._snapshot_mtimes[operacion] = mtime
+            return True
+        except Exception as e:
+            print(f"Snapshot inválido para operación {operacion}, se ignora: {str(e)}")
+            return False
+    
+    def _sync_from_disk(self, operacion: int) -> bool:
+        """
+        Adopta el snapshot que otro worker del host haya guardado después del nuestro,
+        si todavía está vigente. Devuelve True si ya no hace falta ir al upstream.
+        """
+        path = self._snapshot_path(operacion)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        if mtime == self._snapshot_mtimes.get(operacion):
+            return False
+        if time.time() - mtime >= self.cache_ttls[operacion] * self.REFRESH_AHEAD:
+            return False
+        return self._load_snapshot(operacion)
+    
+    @contextmanager
+    def _host_lock(self, operacion: int):
+        """
+        Lock de archivo por operación: un solo worker del host descarga a la vez.
+        Dentro de un request se espera a lo sumo su presupuesto; devuelve False si no se obtuvo.
+        """
+        if fcntl is None or self.use_mock:
+            yield True
+            return
+        try:
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            lock_file = open(os.path.join(self.CACHE_DIR, f"operacion_{operacion}.lock"), 'a')
+        except OSError:
+            yield True
+            return
+        with lock_file:
+            remaining = _remaining_budget()
+            if remaining is None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + remaining
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        now = time.monotonic()
+                        if now >= deadline:
+                            yield False
+                            return
+                        time.sleep(min(self.HOST_LOCK_POLL, deadline - now))
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _save_snapshot(self, operacion: int, data, timestamp: float):
+        """Guarda el snapshot de una operación de forma atómica (archivo temporal + rename)"""
+        try:
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            path = self._snapshot_path(operacion)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            snapshot = {'saved_at': timestamp, 'validators': self.validators.get(operacion, {})}
+            if isinstance(data, CompactCatalog):
+                # Columnas en JSON y matriz de precios en .npy (con nombre único por versión, para
+                # no pisar el archivo que otros workers tienen mapeado)
+                precios_name = f"operacion_{operacion}.{int(timestamp * 1000)}.{os.getpid()}.npy"
+                precios_path = self._precios_path(precios_name)
+                with open(f"{precios_path}.tmp", 'wb') as f:
+                    np.save(f, np.ascontiguousarray(data.precios))
+                os.replace(f"{precios_path}.tmp", precios_path)
+                snapshot['catalog'] = data.to_columns()
+                snapshot['precios'] = precios_name
+            else:
+                snapshot['data'] = data
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._snapshot_mtimes[operacion] = os.path.getmtime(path)
+            if isinstance(data, CompactCatalog):
+                # A partir de acá el proceso usa la copia mapeada, compartida con el resto del host
+                data.precios = np.load(precios_path, mmap_mode='r')
+                self._remove_old_precios(operacion, keep=precios_name)
+        except OSError as e:
+            print(f"No se pudo guardar el snapshot de la operación {operacion}: {str(e)}")
+    
+    def _remove_old_precios(self, operacion: int, keep: Optional[str] = None):
+        """Borra matrices de precios de versiones anteriores (los mapeos abiertos siguen siendo válidos)"""
+        prefix = f"operacion_{operacion}."
+        try:
+            names = os.listdir(self.CACHE_DIR)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name.endswith('.npy') and name != keep:
+                try:
+                    os.remove(self._precios_path(name))
+                except OSError:
+                    pass
+    
+    def _build_catalog(self, chunks, path):
+        """Arma el catálogo compacto a medida que llegan los artículos, sin cargar el JSON completo"""
+        extras = {}
+        builder = CatalogBuilder()
+        for articulo in iter_json_array(chunks, path, extras):
+            builder.add(articulo)
+        prefix = '.'.join(path[:-1])
+        extra_payload = {
+            key[len(prefix) + 1:] if prefix else key: value
+            for key, value in extras.items()
+            if not prefix or key.startswith(prefix + '.')
+        }
+        return builder.build(extra_payload, previous=self.indexes.get(3)), extras
+    
+    def _get_mock_data(self, operacion: int) -> Dict:
+        if operacion == 1:
+            return MOCK_CLIENTES_OBRAS
+        elif operacion == 2:
+            return MOCK_SOCIEDADES
+        elif operacion == 3:
+            return MOCK_ARTICULOS
+        return {"resultado": 0, "error": "Operación no válida"}
+    
+    def _mock_snapshot(self, operacion: int):
+        """(datos, índice) de prueba de una operación; nunca se guardan en el cache compartido"""
+        snapshot = self._mock_snapshots.get(operacion)
+        if snapshot is None:
+            data = self._get_mock_data(operacion)
+            if operacion == 3:
+                # Versión 0: no se confunde con ningún catálogo real en el cache de búsquedas ni en cursores
+                data = index = CompactCatalog.from_payload(data)
+            else:
+                builder = self.INDEX_BUILDERS.get(operacion)
+                index = builder(data) if builder is not None else None
+            snapshot = self._mock_snapshots[operacion] = (data, index)
+        return snapshot
+    
+    def _call_timeouts(self, remaining: Optional[float]):
+        """(connect, read) para requests, acotados por lo que queda del presupuesto del request"""
+        if remaining is None:
+            return self.CONNECT_TIMEOUT, self.READ_TIMEOUT
+        return min(self.CONNECT_TIMEOUT, remaining), min(self.READ_TIMEOUT, remaining)
+    
+    def _within_deadline(self, chunks, remaining: Optional[float]):
+        """Corta la descarga en streaming si se agota el presupuesto del request"""
+        if remaining is None:
+            yield from chunks
+            return
+        deadline = time.monotonic() + remaining
+        for chunk in chunks:
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout("Se agotó el presupuesto de tiempo del request")
+            yield chunk
+    
+    def _fallback(self, operacion: int, fallback_to_mock: bool, reason: str) -> Optional[Dict]:
+        """
+        Resultado cuando no se pudo (o no se quiso) llamar a HDL: None para los refrescos
+        (se conserva el dato anterior); para requests sin dato, el último snapshot bueno o mocks.
+        Los mocks sólo se devuelven a este request: el cache guarda únicamente datos de HDL.
+        """
+        cache_key = f"operacion_{operacion}"
+        if not fallback_to_mock:
+            print(f"{reason}, keeping previous snapshot")
+            return None
+        if cache_key in self.cache:
+            print(f"{reason}, serving last snapshot")
+            return self.cache[cache_key][0]
+        # Fallback a datos de prueba si falla la API
+        print(f"{reason}, using mock data")
+        return self._mock_snapshot(operacion)[0]
+    
+    def _fetch(self, operacion: int, fallback_to_mock: bool = True) -> Optional[Dict]:
+        """
+        Descarga una operación desde la API de HDL y actualiza cache y snapshot.
+        Si falla y fallback_to_mock es False devuelve None (se conserva el dato anterior).
+        """
         cache_key = f"operacion_{operacion}"
-        
-        # Verificar cache primero
-        cached_data = self._get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
         
         # Usar datos de prueba si está habilitado
         if self.use_mock:
-            if operacion == 1:
-                data = MOCK_CLIENTES_OBRAS
-            elif operacion == 2:
-                data = MOCK_SOCIEDADES
-            elif operacion == 3:
-                data = MOCK_ARTICULOS
-            else:
-                data = {"resultado": 0, "error": "Operación no válida"}
-            
-            self._set_cache_data(cache_key, data)
-            return data
+            self._set_cache_data(cache_key, self._get_mock_data(operacion))
+            return self.cache[cache_key][0]
+        
+        if not self.breaker.allow():
+            self._count('breaker_rejections')
+            return self._fallback(operacion, fallback_to_mock, "HDL circuit open")
+        remaining = _remaining_budget()
+        if remaining is not None and remaining < self.MIN_CALL_BUDGET:
+            self.breaker.release()
+            self._count('deadline_exceeded')
+            return self._fallback(operacion, fallback_to_mock, "Request budget exhausted")
+        deadline = None if remaining is None else time.monotonic() + remaining
         
         try:
-            response = requests.get(
+            with self.session.get(
                 self.BASE_URL,
                 params={'operacion': operacion},
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
+                headers=self._conditional_headers(operacion),
+                timeout=self._call_timeouts(remaining),
+                stream=True
+            ) as response:
+                if response.status_code == 304 and cache_key in self.cache:
+                    # Sin cambios en el upstream: se renueva la vigencia sin descargar nada
+                    self.breaker.record_success()
+                    self._count('not_modified')
+                    self._touch(operacion)
+                    return self.cache[cache_key][0]
+                response.raise_for_status()
+                if operacion == 3:
+                    # El catálogo se procesa en streaming: el pico de memoria no depende de su tamaño
+                    data, _ = self._build_catalog(
+                        self._within_deadline(response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE), remaining),
+                        ('articulos',))
+                else:
+                    data = response.json()
+                # Una respuesta de error del web service no pisa el último snapshot bueno
+                self._validate_payload(operacion, data)
+                self.validators[operacion] = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+            self.breaker.record_success()
             
-            # Guardar en cache
-            self._set_cache_data(cache_key, data)
+            # Guardar en cache y en disco
+            timestamp = time.time()
+            self._set_cache_data(cache_key, data, timestamp)
+            self._save_snapshot(operacion, data, timestamp)
             
-            return data
+            return self.cache[cache_key][0]
+        except requests.exceptions.Timeout as e:
+            if deadline is not None and time.monotonic() >= deadline - self.MIN_CALL_BUDGET:
+                # Cortada por el presupuesto de este request, no por el upstream: no cuenta como falla
+                self.breaker.release()
+                self._count('deadline_exceeded')
+                return self._fallback(operacion, fallback_to_mock, f"Request budget exhausted: {str(e)}")
+            self.breaker.record_failure()
+            return self._fallback(operacion, fallback_to_mock, f"API request failed: {str(e)}")
         except requests.exceptions.RequestException as e:
-            # Fallback a datos de prueba si falla la API
-            print(f"API request failed, using mock data: {str(e)}")
-            if operacion == 1:
-                data = MOCK_CLIENTES_OBRAS
-            elif operacion == 2:
-                data = MOCK_SOCIEDADES
-            elif operacion == 3:
-                data = MOCK_ARTICULOS
-            else:
-                data = {"resultado": 0, "error": "Operación no válida"}
-            
-            self._set_cache_data(cache_key, data)
+            self.breaker.record_failure()
+            return self._fallback(operacion, fallback_to_mock, f"API request failed: {str(e)}")
+        except ValueError as e:
+            # JSON inválido (p. ej. una página HTML de un proxy) o respuesta de error: igual que una falla de red
+            self.breaker.record_failure()
+            return self._fallback(operacion, fallback_to_mock, f"Invalid response from API: {str(e)}")
+        except Exception:
+            # Cualquier otro error también cuenta (y libera la prueba de half_open)
+            self.breaker.record_failure()
+            raise
+    
+    def _validate_payload(self, operacion: int, data):
+        """Lanza ValueError si la respuesta indica un error (resultado 0) o viene sin elementos"""
+        if isinstance(data, CompactCatalog):
+            payload, size = data.extra_payload, len(data)
+        elif isinstance(data, dict):
+            payload, items = data, data.get(self.PAYLOAD_LISTS.get(operacion))
+            size = len(items) if isinstance(items, list) else 0
+        else:
+            raise ValueError(f"Respuesta inesperada para la operación {operacion}")
+        if str(payload.get('resultado')) in ('0', 'False'):
+            raise ValueError(f"El web service respondió resultado={payload.get('resultado')} "
+                             f"({payload.get('error') or 'sin detalle'})")
+        if not size:
+            raise ValueError(f"Respuesta sin {self.PAYLOAD_LISTS.get(operacion)}")
+        if isinstance(data, CompactCatalog) and data.changes is not None:
+            # Un catálogo que perdió la mayoría de los artículos es casi seguro una respuesta
+            # truncada: no se publica como baja masiva
+            previous = len(data.changes.removed) + len(data) - len(data.changes.added)
+            if len(data.changes.removed) > self.CATALOG_MAX_REMOVED_RATIO * previous:
+                raise ValueError(f"El catálogo nuevo elimina {len(data.changes.removed)} de {previous} artículos")
+    
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+    
+    def _begin_flight(self, operacion: int):
+        """Registra un fetch en curso. Devuelve (evento, es_líder)"""
+        with self._lock:
+            flight = self._inflight.get(operacion)
+            if flight is not None:
+                return flight, False
+            flight = self._inflight[operacion] = threading.Event()
+            return flight, True
+    
+    def _end_flight(self, operacion: int, flight: threading.Event):
+        with self._lock:
+            self._inflight.pop(operacion, None)
+        flight.set()
+    
+    def _refresh(self, operacion: int, fallback_to_mock: bool = False) -> Optional[Dict]:
+        """Ejecuta un fetch como líder del single-flight (el llamador ya registró el vuelo)"""
+        self._count('refreshes')
+        data = None
+        try:
+            with self._host_lock(operacion) as locked:
+                if not locked:
+                    # Otro worker del host está descargando y se agotó el presupuesto del request
+                    self._count('deadline_exceeded')
+                    if f"operacion_{operacion}" not in self.cache:
+                        # Arranque en frío: un snapshot vencido en disco es mejor que los mocks
+                        self._load_snapshot(operacion)
+                    data = self._fallback(operacion, fallback_to_mock, "Timed out waiting for host lock")
+                    return data
+                # Mientras esperábamos el lock otro worker pudo haber descargado la operación
+                if self._sync_from_disk(operacion):
+                    self._count('shared_refreshes')
+                    data = self.cache[f"operacion_{operacion}"][0]
+                    return data
+                data = self._fetch(operacion, fallback_to_mock=fallback_to_mock)
             return data
-        except json.JSONDecodeError as e:
-            raise Exception(f"Error al decodificar respuesta JSON: {str(e)}")
+        finally:
+            if data is None:
+                self._count('refresh_failures')
+    
+    def _refresh_in_background(self, operacion: int) -> threading.Event:
+        """Lanza un refresco en segundo plano salvo que ya haya uno en curso para la operación"""
+        flight, leader = self._begin_flight(operacion)
+        if not leader:
+            return flight
+        
+        def run():
+            try:
+                self._refresh(operacion)
+            finally:
+                self._end_flight(operacion, flight)
+        
+        threading.Thread(target=run, name=f"hdl-refresh-{operacion}", daemon=True).start()
+        return flight
+    
+    def _make_request(self, operacion: int) -> Dict:
+        """Realiza una petición a la API de HDL o devuelve datos de prueba"""
+        cache_key = f"operacion_{operacion}"
+        
+        # Verificar cache primero
+        cached_data = self._get_cached_data(cache_key)
+        if cached_data is not None:
+            self._count('hits')
+            return cached_data
+        
+        # Stale-while-revalidate: servir el último dato conocido y refrescar en segundo plano
+        # (si el scheduler está activo, él se encarga del refresco)
+        if cache_key in self.cache:
+            self._count('stale_hits')
+            if not self.scheduler_running():
+                flight = self._refresh_in_background(operacion)
+                wait = self.single_flight_wait
+                remaining = _remaining_budget()
+                if remaining is not None:
+                    wait = min(wait, max(0, remaining))
+                if wait > 0 and not flight.wait(wait):
+                    self._count('wait_timeouts')
+            return self.cache[cache_key][0]
+        
+        # Sin datos: un solo request va al upstream y el resto espera su resultado
+        flight, leader = self._begin_flight(operacion)
+        if not leader:
+            self._count('coalesced')
+            # El fetch en curso puede no tener deadline (p. ej. el scheduler): se espera a lo sumo el propio
+            remaining = _remaining_budget()
+            if not flight.wait(None if remaining is None else max(0, remaining)):
+                self._count('wait_timeouts')
+            if cache_key in self.cache:
+                return self.cache[cache_key][0]
+            # Sin presupuesto (o falló el fetch en curso): no se vuelve a llamar a HDL
+            return self._fallback(operacion, True, "No data after waiting for the in-flight fetch")
+        
+        self._count('misses')
+        try:
+            return self._refresh(operacion, fallback_to_mock=True)
+        finally:
+            self._end_flight(operacion, flight)
+    
+    def _next_refresh_delay(self, operacion: int) -> float:
+        """Segundos hasta el próximo refresco programado de una operación"""
+        cache_key = f"operacion_{operacion}"
+        if cache_key not in self.cache:
+            return 0
+        ttl = self.cache_ttls[operacion]
+        age = time.time() - self.cache[cache_key][1]
+        jitter = random.uniform(-self.REFRESH_JITTER, self.REFRESH_JITTER) * ttl
+        return max(0, ttl * self.REFRESH_AHEAD + jitter - age)
+    
+    def _scheduler_loop(self, operacion: int, stop: threading.Event):
+        while not stop.is_set():
+            if stop.wait(self._next_refresh_delay(operacion)):
+                return
+            flight, leader = self._begin_flight(operacion)
+            if not leader:
+                flight.wait()
+                continue
+            try:
+                data = self._refresh(operacion)
+            finally:
+                self._end_flight(operacion, flight)
+            if data is None:
+                # Falló el upstream: reintentar antes de que el snapshot expire del todo
+                stop.wait(min(60, self.cache_ttls[operacion] * (1 - self.REFRESH_AHEAD)))
+    
+    def start_refresh_scheduler(self):
+        """
+        Inicia un hilo por operación que refresca los datos antes de que expiren,
+        de modo que las peticiones nunca esperen al web service de HDL.
+        """
+        if self.use_mock or self.scheduler_running():
+            return
+        self._scheduler_stop = threading.Event()
+        self._scheduler_threads = [
+            threading.Thread(target=self._scheduler_loop, args=(operacion, self._scheduler_stop),
+                             name=f"hdl-scheduler-{operacion}", daemon=True)
+            for operacion in self.OPERACIONES
+        ]
+        for thread in self._scheduler_threads:
+            thread.start()
+    
+    def stop_refresh_scheduler(self):
+        self._scheduler_stop.set()
+        self._scheduler_threads = []
+    
+    def scheduler_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._scheduler_threads)
+    
+    def get_metrics(self) -> Dict:
+        """Contadores del cache y antigüedad de cada operación, para monitoreo"""
+        now = time.time()
+        with self._lock:
+            stats = dict(self.stats)
+            inflight = sorted(self._inflight)
+        catalogo = self.indexes.get(3)
+        return {
+            'cache': stats,
+            'catalogo': {
+                'articulos': len(catalogo),
+                'listas': len(catalogo.lista_codigos),
+                'precios_bytes': catalogo.nbytes,
+            } if catalogo is not None else None,
+            'inflight': inflight,
+            'scheduler_running': self.scheduler_running(),
+            'search_cache': self.search_cache.get_metrics(),
+            'breaker': self.breaker.get_metrics(),
+            'operaciones': {
+                str(operacion): {
+                    'ttl': self.cache_ttls[operacion],
+                    'age': round(now - self.cache[f"operacion_{operacion}"][1], 3)
+                    if f"operacion_{operacion}" in self.cache else None,
+                }
+                for operacion in self.OPERACIONES
+            },
+        }
     
     def get_clientes_y_obras(self) -> Dict:
         """
@@ -87,50 +733,39 @@ class HDLApiService:
         """
         return self._make_request(1)
 
+    def _match_clientes(self, query: str):
+        """Todas las coincidencias de clientes/obras (cacheadas por versión de los datos) y esa versión"""
+        index = self._get_index(1)
+        cache_key = ('clientes', (query or '').lower().strip())
+        results = self.search_cache.get(cache_key, index.version)
+        if results is None:
+            results = index.search(query)
+            self.search_cache.set(cache_key, index.version, results)
+        return results, index.version
+    
     def search_clientes(self, query: str, limit: int = 50) -> List[Dict]:
         """
         Busca clientes y/o obras por término. Coincide por razón social, CUIT o nombre de obra.
         Devuelve una lista simplificada: [{ razon_social, cuit, obras: [{codigo, nombre, listas: [...] }] }]
         """
         try:
-            data = self.get_clientes_y_obras()
-            clientes = data.get('clientes', [])
-            query_lower = (query or '').lower().strip()
-            results: List[Dict] = []
-
-            for cliente in clientes:
-                if len(results) >= limit:
-                    break
-
-                datos = cliente.get('datos', {})
-                razon = (datos.get('razon_social') or '').lower()
-                cuit = (datos.get('cuit') or '').lower()
-                obras = cliente.get('obras', [])
-
-                # Coincidencia por cliente
-                cliente_match = (query_lower in razon) or (query_lower and query_lower in cuit)
-
-                # Filtrar obras coincidentes por nombre
-                obras_match = []
-                for obra in obras:
-                    nombre_obra = (obra.get('nombre') or '').lower()
-                    if query_lower in nombre_obra or cliente_match:
-                        obras_match.append({
-                            'codigo': obra.get('codigo'),
-                            'nombre': obra.get('nombre'),
-                            'listas': obra.get('listas', [])
-                        })
-
-                if cliente_match or obras_match:
-                    results.append({
-                        'razon_social': datos.get('razon_social'),
-                        'cuit': datos.get('cuit'),
-                        'obras': obras_match
-                    })
-
-            return results
+            results, _ = self._match_clientes(query)
+            return results[:limit]
+        except Exception as e:
+            raise Exception(f"Error al buscar clientes: {str(e)}")
+    
+    def search_clientes_page(self, query: str, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """
+        Página de la búsqueda de clientes: {items, total, next_cursor}. El cursor (opaco) se
+        obtiene de la página anterior y deja de valer si cambian los datos de clientes (ValueError).
+        """
+        try:
+            results, version = self._match_clientes(query)
         except Exception as e:
             raise Exception(f"Error al buscar clientes: {str(e)}")
+        fingerprint = query_fingerprint('clientes', (query or '').lower().strip())
+        offset = decode_cursor(cursor, version, fingerprint)
+        return paginate(results, offset, limit, version, fingerprint)
     
     def get_sucursales_y_sociedades(self) -> Dict:
         """
@@ -142,46 +777,107 @@ class HDLApiService:
         """
         Operación 3: Obtiene el catálogo completo de artículos y precios
         """
+        return self.get_catalogo().to_payload()
+    
+    def get_catalogo(self) -> CompactCatalog:
+        """
+        Operación 3 en formato compacto (columnas + matriz de precios)
+        """
         return self._make_request(3)
     
-    def search_articulos(self, query: str, limit: int = 50) -> List[Dict]:
+    def peek_catalogo(self) -> Optional[CompactCatalog]:
         """
-        Busca artículos por nombre o código
+        Catálogo si ya está en memoria (vigente o vencido), sin esperar una descarga de HDL; None si no
+        """
+        if "operacion_3" not in self.cache:
+            return None
+        return self.get_catalogo()
+    
+    def search_articulos(self, query: str, limit: int = 50, fuzzy: bool = False) -> List[Dict]:
+        """
+        Busca artículos por nombre o código (todos los términos deben coincidir),
+        ordenados por calidad de coincidencia.
+        Con fuzzy=True tolera acentos, errores de tipeo y texto libre (p. ej. mensajes de WhatsApp).
         """
         try:
-            data = self.get_articulos_y_precios()
-            articulos = data.get('articulos', [])
-            
-            query_lower = query.lower()
-            results = []
-            
-            for articulo in articulos:
-                if len(results) >= limit:
-                    break
-                
-                nombre = articulo.get('nombre', '').lower()
-                codigo = articulo.get('codigo', '').lower()
-                
-                if query_lower in nombre or query_lower in codigo:
-                    results.append(articulo)
-            
+            catalogo = self.get_catalogo()
+            # La versión del catálogo sólo cambia si cambió su contenido
+            cache_key = ('articulos', ' '.join(normalize(query or '').split()), limit, fuzzy)
+            cached = self.search_cache.get(cache_key, catalogo.version)
+            if cached is not None:
+                return cached
+            results = catalogo.search(query, limit, fuzzy=fuzzy)
+            self.search_cache.set(cache_key, catalogo.version, results)
             return results
         except Exception as e:
             raise Exception(f"Error al buscar artículos: {str(e)}")
     
+    def search_articulos_page(self, query: str, limit: int = 50, cursor: Optional[str] = None,
+                              fuzzy: bool = False) -> Dict:
+        """
+        Página de la búsqueda de artículos: {items, total, next_cursor}, con el mismo orden que
+        search_articulos. El ranking completo se cachea y cada página sólo arma sus artículos.
+        El cursor deja de valer si cambia la versión del catálogo (ValueError).
+        """
+        normalized = ' '.join(normalize(query or '').split())
+        try:
+            catalogo = self.get_catalogo()
+            if normalized:
+                cache_key = ('articulos_ranking', normalized, fuzzy)
+                ranked = self.search_cache.get(cache_key, catalogo.version)
+                if ranked is None:
+                    ranked = catalogo.rank(query, fuzzy=fuzzy)
+                    self.search_cache.set(cache_key, catalogo.version, ranked)
+            else:
+                # Una consulta sin letras ni números (p. ej. "!!!") no coincide con nada,
+                # en lugar de paginar el catálogo completo
+                ranked = []
+        except Exception as e:
+            raise Exception(f"Error al buscar artículos: {str(e)}")
+        fingerprint = query_fingerprint('articulos', normalized, fuzzy)
+        offset = decode_cursor(cursor, catalogo.version, fingerprint)
+        page = paginate(ranked, offset, limit, catalogo.version, fingerprint)
+        page['items'] = [catalogo.get_articulo(codigo) for codigo in page['items']]
+        return page
+    
+    def autocomplete(self, query: str, limit: int = 8) -> Dict:
+        """
+        Sugerencias por prefijo para escribir con autocompletado: artículos (nombre o código)
+        y clientes/obras (razón social, CUIT o nombre de obra), hasta limit de cada tipo.
+        """
+        try:
+            return {
+                'articulos': self.get_catalogo().autocomplete(query, limit),
+                'clientes': self._get_index(1).autocomplete(query, limit),
+            }
+        except Exception as e:
+            raise Exception(f"Error al autocompletar: {str(e)}")
+    
+    def get_catalog_changes(self, since: int) -> Dict:
+        """
+        Cambios del catálogo (altas, bajas, renombres y cambios de precio) posteriores a una versión.
+        Si el historial no cubre la versión pedida, reset=True indica que hay que recargar todo.
+        """
+        try:
+            catalogo = self.get_catalogo()
+            with self._lock:
+                history = list(self.catalog_changes)
+            oldest = history[0]['version'] - 1 if history else catalogo.version
+            reset = since > catalogo.version or since < oldest
+            return {
+                'version': catalogo.version,
+                'reset': reset,
+                'changes': [] if reset else [entry for entry in history if entry['version'] > since],
+            }
+        except Exception as e:
+            raise Exception(f"Error al obtener cambios del catálogo: {str(e)}")
+    
     def get_articulo_by_codigo(self, codigo: str) -> Optional[Dict]:
         """
         Obtiene un artículo específico por su código
         """
         try:
-            data = self.get_articulos_y_precios()
-            articulos = data.get('articulos', [])
-            
-            for articulo in articulos:
-                if articulo.get('codigo') == codigo:
-                    return articulo
-            
-            return None
+            return self.get_catalogo().get_articulo(codigo)
         except Exception as e:
             raise Exception(f"Error al obtener artículo: {str(e)}")
     
@@ -190,37 +886,174 @@ class HDLApiService:
         Obtiene las listas de precios disponibles para una obra específica
         """
         try:
-            data = self.get_clientes_y_obras()
-            clientes = data.get('clientes', [])
-            
-            for cliente in clientes:
-                obras = cliente.get('obras', [])
-                for obra in obras:
-                    if obra.get('codigo') == codigo_obra:
-                        return obra.get('listas', [])
-            
-            return []
+            return self._get_index(1).get_listas(codigo_obra)
         except Exception as e:
             raise Exception(f"Error al obtener listas de precios: {str(e)}")
     
+    def get_cliente_by_cuit(self, cuit: str) -> Optional[Dict]:
+        """
+        Obtiene un cliente (datos, sociedades y obras) por su CUIT
+        """
+        try:
+            return self._get_index(1).get_cliente(cuit)
+        except Exception as e:
+            raise Exception(f"Error al obtener cliente: {str(e)}")
+    
     def get_precio_articulo(self, codigo_articulo: str, codigo_lista: str) -> Optional[float]:
         """
         Obtiene el precio de un artículo en una lista específica
         """
         try:
-            articulo = self.get_articulo_by_codigo(codigo_articulo)
-            if not articulo:
+            return self.get_catalogo().get_precio(codigo_articulo, codigo_lista)
+        except Exception as e:
+            raise Exception(f"Error al obtener precio: {str(e)}")
+    
+    def _parse_budget_items(self, items: List[Dict]):
+        """
+        Códigos y cantidades de las líneas de un presupuesto.
+        Items mal formados se propagan como ValueError/TypeError (error del cliente).
+        """
+        codigos = [str(item.get('codigo', '')) for item in items]
+        cantidades = np.array([float(item.get('cantidad', 1)) for item in items], dtype=np.float64)
+        if not np.isfinite(cantidades).all():
+            # "nan"/"inf" pasan float() pero dejarían totales que no son JSON válido
+            raise ValueError("Las cantidades deben ser números finitos")
+        return codigos, cantidades
+    
+    def _check_totals(self, totales: np.ndarray, subtotales: np.ndarray):
+        """
+        Lanza OverflowError si algún total no es finito: cantidades enormes (p. ej. 1e308)
+        desbordan al multiplicarse y dejarían "Infinity" en la respuesta, que no es JSON válido
+        """
+        if not (np.isfinite(totales).all() and np.isfinite(subtotales * (1 + self.IVA_RATE)).all()):
+            raise OverflowError("Los totales del presupuesto exceden el rango numérico")
+    
+    def _lista_codigo(self, lista: Dict, catalogo: CompactCatalog) -> str:
+        """
+        Código de catálogo de una lista de obra. En la operación 1 el código numérico
+        suele venir en 'nombre' (y el nombre en 'codigo'), así que se prueban ambos.
+        """
+        for key in ('codigo', 'nombre'):
+            value = str(lista.get(key) or '')
+            if value in catalogo.col_by_lista:
+                return value
+        return str(lista.get('nombre') or lista.get('codigo') or '')
+    
+    def quote_budget(self, codigo_lista: str, items: List[Dict]) -> Optional[Dict]:
+        """
+        Cotiza un presupuesto completo en una lista de precios: items es [{codigo, cantidad}].
+        Devuelve las líneas con precio_unitario y total (sin_precio=True si el artículo no existe
+        o no tiene precio en la lista), subtotal, IVA y total. None si la lista no existe.
+        """
+        codigos, cantidades = self._parse_budget_items(items)
+        try:
+            catalogo = self.get_catalogo()
+            if codigo_lista not in catalogo.col_by_lista:
                 return None
+            rows = catalogo.rows_for(codigos)
+            precios = catalogo.precios_for(rows, codigo_lista)
+            sin_precio = np.isnan(precios)
+            with np.errstate(over='ignore'):
+                # Un desborde se reporta con _check_totals, no como warning de numpy
+                totales = np.where(sin_precio, 0.0, precios * cantidades)
+                self._check_totals(totales, totales.sum())
+            subtotal = round(float(totales.sum()), 2)
+            iva = round(subtotal * self.IVA_RATE, 2)
             
-            precios = articulo.get('precios', [])
-            for precio in precios:
-                if precio.get('codigo') == codigo_lista:
-                    precio_str = precio.get('precio', '0')
-                    return float(precio_str)
+            lines = [
+                {
+                    'codigo': codigo,
+                    'nombre': catalogo.nombres[row] if row >= 0 else None,
+                    'cantidad': cantidad,
+                    'precio_unitario': None if missing else precio,
+                    'total': round(total, 2),
+                    'sin_precio': missing,
+                }
+                for codigo, row, cantidad, precio, total, missing in zip(
+                    codigos, rows.tolist(), cantidades.tolist(), precios.tolist(),
+                    totales.tolist(), sin_precio.tolist())
+            ]
+            return {
+                'lista': {
+                    'codigo': codigo_lista,
+                    'nombre': catalogo.lista_nombres[catalogo.col_by_lista[codigo_lista]],
+                },
+                'items': lines,
+                'subtotal': subtotal,
+                'iva': iva,
+                'total': round(subtotal + iva, 2),
+                'sin_precio': int(sin_precio.sum()),
+            }
+        except OverflowError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error al cotizar presupuesto: {str(e)}")
+    
+    def compare_listas_obra(self, codigo_obra: str, items: List[Dict]) -> Optional[Dict]:
+        """
+        Compara un presupuesto completo en todas las listas de precios de una obra.
+        Devuelve el total de cada lista (con la cantidad de líneas sin precio) y, por línea,
+        el precio en cada lista y las listas donde falta. None si la obra no tiene listas.
+        """
+        codigos, cantidades = self._parse_budget_items(items)
+        try:
+            listas_obra = self._get_index(1).get_listas(codigo_obra)
+            if not listas_obra:
+                return None
+            catalogo = self.get_catalogo()
+            listas = [self._lista_codigo(lista, catalogo) for lista in listas_obra]
             
-            return None
+            rows = catalogo.rows_for(codigos)
+            precios = catalogo.precios_matrix(rows, listas)
+            sin_precio = np.isnan(precios)
+            with np.errstate(over='ignore'):
+                totales = np.where(sin_precio, 0.0, precios * cantidades[:, None])
+                subtotales = totales.sum(axis=0)
+                self._check_totals(totales, subtotales)
+            faltantes = sin_precio.sum(axis=0)
+            
+            comparacion = []
+            for j, lista in enumerate(listas):
+                col = catalogo.col_by_lista.get(lista)
+                subtotal = round(float(subtotales[j]), 2)
+                iva = round(subtotal * self.IVA_RATE, 2)
+                comparacion.append({
+                    'codigo': lista,
+                    'nombre': catalogo.lista_nombres[col] if col is not None else None,
+                    'subtotal': subtotal,
+                    'iva': iva,
+                    'total': round(subtotal + iva, 2),
+                    'sin_precio': int(faltantes[j]),
+                    'completa': bool(faltantes[j] == 0),
+                })
+            
+            # Primero las listas que cotizan más líneas; entre ellas, la de menor total
+            mas_barata = min(comparacion, key=lambda lista: (lista['sin_precio'], lista['total']))['codigo']
+            
+            lines = [
+                {
+                    'codigo': codigo,
+                    'nombre': catalogo.nombres[row] if row >= 0 else None,
+                    'cantidad': cantidad,
+                    'precios': {
+                        lista: None if missing else precio
+                        for lista, precio, missing in zip(listas, fila, faltas)
+                    },
+                    'sin_precio': [lista for lista, missing in zip(listas, faltas) if missing],
+                }
+                for codigo, row, cantidad, fila, faltas in zip(
+                    codigos, rows.tolist(), cantidades.tolist(), precios.tolist(), sin_precio.tolist())
+            ]
+            return {
+                'codigo_obra': codigo_obra,
+                'listas': comparacion,
+                'mas_barata': mas_barata,
+                'items': lines,
+            }
+        except OverflowError:
+            raise
         except Exception as e:
-            raise Exception(f"Error al obtener precio: {str(e)}")
+            raise Exception(f"Error al comparar listas de precios: {str(e)}")
     
     def get_sociedades(self) -> List[Dict]:
         """
@@ -233,6 +1066,17 @@ class HDLApiService:
             raise Exception(f"Error al obtener sociedades: {str(e)}")
     
     def clear_cache(self):
-        """Limpia el cache"""
+        """Limpia el cache en memoria y los snapshots guardados en disco"""
         self.cache.clear()
+        self.indexes.clear()
+        self.catalog_changes.clear()
+        self.validators.clear()
+        self._snapshot_mtimes.clear()
+        self.search_cache.clear()
+        for operacion in self.OPERACIONES:
+            try:
+                os.remove(self._snapshot_path(operacion))
+            except FileNotFoundError:
+                pass
+        self._remove_old_precios(3)
 
@@ -0,0 +1,89 @@
+import json
+import zlib
+from typing import Dict, List, Optional
+
+from src.services.search_index import PrefixIndex
+
+
+class ClientesIndex:
+    """Índices de clientes y obras (operación 1), construidos una vez por snapshot"""
+
+    def __init__(self, data: Dict):
+        self.clientes: List[Dict] = data.get('clientes', [])
+        # cuit -> cliente
+        self.by_cuit: Dict[str, Dict] = {}
+        # codigo de obra -> listas de precios
+        self.listas_by_obra: Dict[str, List[Dict]] = {}
+
+        for cliente in self.clientes:
+            cuit = (cliente.get('datos') or {}).get('cuit')
+            if cuit:
+                self.by_cuit.setdefault(cuit, cliente)
+            for obra in cliente.get('obras', []):
+                self.listas_by_obra.setdefault(obra.get('codigo'), obra.get('listas', []))
+        self.autocomplete_index = PrefixIndex(self._autocomplete_docs())
+        # Huella del contenido: igual en todos los workers que tengan los mismos datos
+        self.version = zlib.crc32(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+    def _autocomplete_docs(self):
+        """Clientes (razón social, CUIT) y obras (nombre, código) para autocompletar"""
+        for cliente in self.clientes:
+            datos = cliente.get('datos') or {}
+            razon_social = datos.get('razon_social') or ''
+            cuit = datos.get('cuit')
+            yield {'tipo': 'cliente', 'razon_social': razon_social, 'cuit': cuit}, razon_social, (cuit,)
+            for obra in cliente.get('obras', []):
+                payload = {
+                    'tipo': 'obra',
+                    'codigo': obra.get('codigo'),
+                    'nombre': obra.get('nombre'),
+                    'razon_social': razon_social,
+                    'cuit': cuit,
+                }
+                yield payload, obra.get('nombre') or '', (obra.get('codigo'),)
+
+    def get_cliente(self, cuit: str) -> Optional[Dict]:
+        return self.by_cuit.get(cuit)
+
+    def get_listas(self, codigo_obra: str) -> List[Dict]:
+        return self.listas_by_obra.get(codigo_obra, [])
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Clientes y/o obras que coinciden por razón social, CUIT o nombre de obra, en el orden
+        de la operación 1: [{ razon_social, cuit, obras: [{codigo, nombre, listas: [...] }] }]
+        """
+        query_lower = (query or '').lower().strip()
+        results: List[Dict] = []
+
+        for cliente in self.clientes:
+            datos = cliente.get('datos', {})
+            razon = (datos.get('razon_social') or '').lower()
+            cuit = (datos.get('cuit') or '').lower()
+            obras = cliente.get('obras', [])
+
+            # Coincidencia por cliente
+            cliente_match = (query_lower in razon) or (query_lower and query_lower in cuit)
+
+            # Filtrar obras coincidentes por nombre
+            obras_match = []
+            for obra in obras:
+                nombre_obra = (obra.get('nombre') or '').lower()
+                if query_lower in nombre_obra or cliente_match:
+                    obras_match.append({
+                        'codigo': obra.get('codigo'),
+                        'nombre': obra.get('nombre'),
+                        'listas': obra.get('listas', [])
+                    })
+
+            if cliente_match or obras_match:
+                results.append({
+                    'razon_social': datos.get('razon_social'),
+                    'cuit': datos.get('cuit'),
+                    'obras': obras_match
+                })
+
+        return results
+
+    def autocomplete(self, query: str, limit: int = 8) -> List[Dict]:
+        return self.autocomplete_index.complete(query, limit)
@@ -0,0 +1,211 @@
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.services.search_index import fold_accents
+
+
+# Palabras clave por tipo de consulta (también las usa SimpleAIService)
+INTENT_KEYWORDS = {
+    'greeting': ['hola', 'buenos', 'buenas', 'saludos'],
+    'cement': ['cemento', 'cal', 'yeso'],
+    'house': ['casa', 'vivienda', 'm2', 'metros'],
+    'materials': ['material', 'producto', 'articulo', 'precio'],
+}
+
+PRODUCT_SEARCH_KEYWORDS = [
+    'cemento', 'cal', 'yeso', 'ladrillo', 'bloque', 'arena',
+    'piedra', 'adhesivo', 'klaukol', 'material', 'producto',
+    'precio', 'costo', 'cuanto', 'disponible',
+]
+
+# Turnos triviales que se responden sin el modelo: frases que los componen y respuesta.
+# Un turno califica si (casi) todo su texto está cubierto por frases de un mismo intent.
+TRIVIAL_INTENTS = {
+    'greeting': {
+        'phrases': INTENT_KEYWORDS['greeting'] + [
+            'buen dia', 'buenos dias', 'buenas tardes', 'buenas noches', 'que tal', 'como estas',
+            'como va', 'como andas', 'hola que tal',
+        ],
+        'response': '¡Hola! ¿En qué presupuesto trabajamos? Indique cliente, obra, lista de precios y materiales.',
+        'next_step': 'continue_conversation',
+        'quick_replies': [],
+    },
+    # Sin afirmaciones ('ok', 'dale', 'listo', 'perfecto'...): suelen confirmar lo que preguntó
+    # el asistente (p. ej. un pedido) y esa respuesta depende del historial, así que van al modelo
+    'thanks': {
+        'phrases': ['gracias', 'muchas gracias', 'mil gracias'],
+        'response': 'De nada. ¿Seguimos con el presupuesto o necesita algo más?',
+        'next_step': 'continue_conversation',
+        'quick_replies': [],
+    },
+    'add_obra': {
+        'phrases': ['agregar obra'],
+        'response': 'Indique el nombre o código de la obra (o el cliente) y la busco en el sistema.',
+        'next_step': 'select_obra',
+        'quick_replies': ['Buscar en el sistema', 'Agregar lista de precios'],
+    },
+    'add_price_list': {
+        'phrases': ['agregar lista de precios'],
+        'response': '¿Con qué lista de precios cotizamos? Indique el código o la obra para ver sus listas.',
+        'next_step': 'select_price_list',
+        'quick_replies': ['Agregar obra', 'Agregar materiales y cantidades'],
+    },
+    'add_items': {
+        'phrases': ['agregar materiales y cantidades', 'agregar mas'],
+        'response': 'Envíe los materiales con sus cantidades, uno por línea (por ejemplo: 10 bolsas de cemento).',
+        'next_step': 'add_items',
+        'quick_replies': [],
+    },
+    'search_system': {
+        'phrases': ['buscar en el sistema'],
+        'response': '¿Qué busco? Puede ser un artículo, un cliente o una obra.',
+        'next_step': 'search',
+        'quick_replies': [],
+    },
+    'more_info': {
+        'phrases': ['proporcionar mas informacion'],
+        'response': 'Cuénteme los datos que falten: cliente, obra, lista de precios, materiales y cantidades.',
+        'next_step': 'continue_conversation',
+        'quick_replies': [],
+    },
+}
+
+_SEPARATORS_RE = re.compile(r"[^\w]+")
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas, sin acentos ni signos, con espacios simples"""
+    return ' '.join(_SEPARATORS_RE.sub(' ', fold_accents(text.lower())).split())
+
+
+class KeywordAutomaton:
+    """
+    Autómata de Aho-Corasick sobre frases normalizadas: encuentra todas las apariciones
+    (como palabras completas) en una sola pasada por el texto, sin importar cuántas frases haya.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, int]]] = [[]]
+        for phrase, label in patterns:
+            phrase = _normalize(phrase)
+            if not phrase:
+                continue
+            state = 0
+            for char in phrase:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            if (label, len(phrase)) not in self._out[state]:
+                self._out[state].append((label, len(phrase)))
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[str, int, int]]:
+        """(label, inicio, fin) de cada frase encontrada en text (ya normalizado)"""
+        matches = []
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        size = len(text)
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not out[state]:
+                continue
+            end = pos + 1
+            # Sólo palabras completas: 'cal' no coincide dentro de 'calle'
+            if end < size and text[end] != ' ':
+                continue
+            for label, length in out[state]:
+                start = end - length
+                if start == 0 or text[start - 1] == ' ':
+                    matches.append((label, start, end))
+        return matches
+
+
+class IntentClassifier:
+    """
+    Clasificador local de intents. Responde sin el modelo los turnos triviales (saludos,
+    agradecimientos y clicks en respuestas rápidas) cuando la confianza (fracción del texto
+    cubierta por frases del intent) alcanza el umbral; el resto se deriva al modelo.
+    """
+
+    THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.9"))
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = self.THRESHOLD if threshold is None else threshold
+        patterns = [(phrase, label) for label, words in INTENT_KEYWORDS.items() for phrase in words]
+        patterns += [(phrase, label) for label, intent in TRIVIAL_INTENTS.items() for phrase in intent['phrases']]
+        self.automaton = KeywordAutomaton(patterns)
+        self._lock = threading.Lock()
+        self.stats = {
+            'classified': 0,
+            'short_circuited': 0,
+            'escalated': 0,
+            'by_intent': {},
+        }
+
+    def classify(self, message: str) -> Tuple[Optional[str], float]:
+        """Intent con mayor cobertura del mensaje y su confianza (0 a 1)"""
+        text = _normalize(message)
+        length = len(text.replace(' ', ''))
+        if not length:
+            return None, 0.0
+        covered: Dict[str, set] = {}
+        for label, start, end in self.automaton.find(text):
+            covered.setdefault(label, set()).update(range(start, end))
+        best, confidence = None, 0.0
+        for label, positions in covered.items():
+            score = sum(1 for pos in positions if text[pos] != ' ') / length
+            if score > confidence:
+                best, confidence = label, score
+        return best, confidence
+
+    def respond(self, message: str, files: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """Respuesta local (mismo formato que el modelo) o None si el turno debe ir al modelo"""
+        intent, confidence = (None, 0.0) if files else self.classify(message)
+        trivial = TRIVIAL_INTENTS.get(intent)
+        short_circuit = trivial is not None and confidence >= self.threshold
+        with self._lock:
+            self.stats['classified'] += 1
+            self.stats['short_circuited' if short_circuit else 'escalated'] += 1
+            if short_circuit:
+                self.stats['by_intent'][intent] = self.stats['by_intent'].get(intent, 0) + 1
+        if not short_circuit:
+            return None
+        return {
+            'response': trivial['response'],
+            'quick_replies': list(trivial['quick_replies']),
+            'next_step': trivial['next_step'],
+            'needs_product_search': False,
+            'client_search_term': None,
+        }
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.stats, by_intent=dict(self.stats['by_intent']))
+        metrics['threshold'] = self.threshold
+        metrics['short_circuit_rate'] = (
+            round(metrics['short_circuited'] / metrics['classified'], 4) if metrics['classified'] else None)
+        return metrics
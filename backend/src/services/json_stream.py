@@ -0,0 +1,121 @@
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Tuple, Union
+
+_WHITESPACE = ' \t\n\r'
+# A partir de cuántos caracteres consumidos se descarta el inicio del buffer
+_COMPACT_AT = 1 << 16
+# Caracteres que pueden seguir a un número ya decodificado y formar parte de él ("0." + "001")
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+
+class _Reader:
+    """Buffer de texto sobre un iterable de chunks (bytes o str) que se lee bajo demanda"""
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def read_more(self) -> bool:
+        while not self.exhausted:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.exhausted = True
+                self.buffer += self._decoder.decode(b'', final=True)
+                return False
+            text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                if self.pos > _COMPACT_AT:
+                    self.buffer = self.buffer[self.pos:]
+                    self.pos = 0
+                self.buffer += text
+                return True
+        return False
+
+    def peek(self) -> str:
+        """Siguiente carácter significativo (sin consumirlo); '' al final del stream"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Se esperaba '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        """Decodifica el próximo valor JSON completo, leyendo más chunks si hace falta"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+            # Un número al final del buffer podría continuar en el próximo chunk (también si
+            # quedó cortado tras '.' o 'e', que raw_decode deja fuera del valor)
+            if not self.exhausted and isinstance(value, (int, float)) and not isinstance(value, bool) \
+                    and _NUMBER_TAIL.fullmatch(self.buffer, end) and self.read_more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], path: Tuple[str, ...],
+                    extras: Dict[str, Any]) -> Iterator[Any]:
+    """
+    Recorre un documento JSON recibido por partes y devuelve uno a uno los elementos
+    del array ubicado en path (p. ej. ('articulos',) o ('data', 'articulos')),
+    sin armar el documento completo en memoria. El resto de las claves encontradas
+    se guardan en extras con su ruta separada por puntos (p. ej. 'data.resultado').
+    """
+    reader = _Reader(chunks)
+    decoder = json.JSONDecoder()
+    yield from _iter_object(reader, decoder, path, extras, '')
+    if reader.peek() != '':
+        raise json.JSONDecodeError('Datos extra al final del documento', reader.buffer, reader.pos)
+
+
+def _iter_object(reader: _Reader, decoder: json.JSONDecoder, path: Tuple[str, ...],
+                 extras: Dict[str, Any], prefix: str) -> Iterator[Any]:
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value(decoder)
+        if not isinstance(key, str):
+            raise json.JSONDecodeError('Se esperaba una clave', reader.buffer, reader.pos)
+        reader.expect(':')
+        if key == path[0] and len(path) > 1 and reader.peek() == '{':
+            yield from _iter_object(reader, decoder, path[1:], extras, f"{prefix}{key}.")
+        elif key == path[0] and len(path) == 1 and reader.peek() == '[':
+            reader.pos += 1
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value(decoder)
+                    if reader.peek() == ',':
+                        reader.pos += 1
+                        continue
+                    reader.expect(']')
+                    break
+        else:
+            extras[f"{prefix}{key}"] = reader.value(decoder)
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect('}')
+        return
@@ -0,0 +1,66 @@
+import base64
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def query_fingerprint(*parts: Any) -> int:
+    """Huella corta de la consulta, para rechazar cursores usados con otra búsqueda"""
+    return zlib.crc32(json.dumps(parts, ensure_ascii=False).encode('utf-8'))
+
+
+def encode_cursor(version: Any, offset: int, fingerprint: int) -> str:
+    raw = json.dumps({'v': version, 'o': offset, 'q': fingerprint}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], version: Any, fingerprint: int) -> int:
+    """
+    Offset guardado en un cursor. Lanza ValueError si el cursor está mal formado, es de
+    otra consulta o de otra versión de los datos (el orden ya no sería el mismo).
+    """
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        offset = int(data['o'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Cursor inválido')
+    if data.get('q') != fingerprint or offset < 0:
+        raise ValueError('Cursor inválido para esta búsqueda')
+    if data.get('v') != version:
+        raise ValueError('Cursor vencido: los datos cambiaron, repetir la búsqueda')
+    return offset
+
+
+def parse_limit(value: Any, default: int, maximum: int) -> int:
+    """
+    Tamaño de página pedido por el cliente (entero o texto con un entero), acotado a maximum.
+    Lanza ValueError si no es un entero mayor a 0.
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError('limit debe ser un entero mayor a 0')
+    try:
+        limit = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('limit debe ser un entero mayor a 0')
+    if limit < 1:
+        raise ValueError('limit debe ser un entero mayor a 0')
+    return min(limit, maximum)
+
+
+def paginate(ranked: Sequence, offset: int, limit: int, version: Any, fingerprint: int) -> Dict:
+    """Página [offset, offset + limit) de un resultado ordenado, con total y cursor siguiente"""
+    if limit < 1:
+        # Con limit 0 el cursor siguiente apuntaría al mismo offset para siempre
+        raise ValueError('limit debe ser un entero mayor a 0')
+    end = offset + limit
+    page: List = list(ranked[offset:end])
+    return {
+        'items': page,
+        'total': len(ranked),
+        'next_cursor': encode_cursor(version, end, fingerprint) if end < len(ranked) else None,
+    }
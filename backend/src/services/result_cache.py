@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def estimate_size(value: Any) -> int:
+    """Tamaño aproximado (bytes) de un resultado serializable: el largo de su JSON"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class ResultCache:
+    """
+    Cache LRU + TTL de resultados con tope en bytes (estimados).
+    Cada entrada guarda la versión de los datos con que se calculó: si la versión
+    vigente es otra, la entrada se descarta. Los valores se comparten entre llamadores
+    y no deben modificarse.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, version: Any) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            value, size, expires, entry_version = entry
+            if entry_version != version or expires <= time.monotonic():
+                self._remove(key, size)
+                self.stats['invalidations' if entry_version != version else 'expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key: Hashable, version: Any, value: Any):
+        if not self.enabled:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._remove(key, previous[1])
+            self._entries[key] = (value, size, time.monotonic() + self.ttl, version)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest, entry = next(iter(self._entries.items()))
+                self._remove(oldest, entry[1])
+                self.stats['evictions'] += 1
+
+    def _remove(self, key: Hashable, size: int):
+        del self._entries[key]
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._entries)
+            used = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': entries,
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+        })
+        return stats
+
+
+class SQLiteResultCache:
+    """
+    Misma interfaz que ResultCache, persistida en SQLite para compartirla entre procesos
+    y reinicios. El tope es por cantidad de entradas; se descartan las usadas hace más tiempo.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, version TEXT, value TEXT NOT NULL, '
+            'expires REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, version: Any) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        key, version = str(key), json.dumps(version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT version, value, expires FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            entry_version, value, expires = row
+            if entry_version != version or expires <= now:
+                self._conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                self.stats['invalidations' if entry_version != version else 'expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+            self.stats['hits'] += 1
+        return json.loads(value)
+
+    def set(self, key: Hashable, version: Any, value: Any):
+        if not self.enabled:
+            return
+        now = time.time()
+        row = (str(key), json.dumps(version), json.dumps(value, ensure_ascii=False), now + self.ttl, now)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (key, version, value, expires, accessed) VALUES (?, ?, ?, ?, ?)', row)
+            excess = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    'DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY expires <= ? DESC, accessed LIMIT ?)', (now, excess))
+                self.stats['evictions'] += excess
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM results')
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'path': self.path,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+        })
+        return stats
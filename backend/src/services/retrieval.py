@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.services.catalog import CompactCatalog
+from src.services.conversation_memory import TokenCounter
+from src.services.search_index import TrigramIndex
+
+
+# Directorio de la base de conocimiento (un JSON por item, ver routes/knowledge.py)
+KNOWLEDGE_DIR = '/tmp/knowledge'
+
+
+class KnowledgeIndex:
+    """
+    Índice en memoria de la base de conocimiento (título y contenido de cada item).
+    Se reconstruye cuando cambian los archivos del directorio, revisándolo a lo sumo
+    cada RELOAD_SECONDS.
+    """
+
+    RELOAD_SECONDS = float(os.getenv("RAG_KNOWLEDGE_RELOAD", "5"))
+
+    def __init__(self, directory: str = KNOWLEDGE_DIR):
+        self.directory = directory
+        self._items: Dict[str, Dict] = {}
+        self._index = TrigramIndex()
+        self._signature: Optional[Tuple] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Tuple:
+        try:
+            return tuple(sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in os.scandir(self.directory) if entry.name.endswith('.json')
+            ))
+        except FileNotFoundError:
+            return ()
+
+    def _refresh(self):
+        if time.monotonic() - self._checked < self.RELOAD_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked < self.RELOAD_SECONDS:
+                return
+            signature = self._scan()
+            if signature != self._signature:
+                items = {}
+                for filename, _ in signature:
+                    try:
+                        with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                            item = json.load(f)
+                    except Exception:
+                        continue
+                    items[str(item.get('id') or filename[:-5])] = item
+                self._index = TrigramIndex(
+                    (key, f"{item.get('title', '')} {item.get('content', '')}", item.get('category', ''))
+                    for key, item in items.items()
+                )
+                self._items, self._signature = items, signature
+            self._checked = time.monotonic()
+
+    def search(self, query: str, limit: int) -> List[Dict]:
+        """Items más relevantes para el texto (alcanza con que coincida algún término)"""
+        self._refresh()
+        items, index = self._items, self._index
+        return [items[key] for key, _ in index.search(query, limit, fuzzy=True)]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Retriever:
+    """
+    Contexto para el modelo antes de cada turno: los items de conocimiento y los artículos del
+    catálogo (con su precio en la lista elegida) más relevantes para el mensaje, dentro de un
+    presupuesto de tokens. El catálogo sólo se usa si ya está en memoria y si la etapa de
+    conocimiento no consumió el presupuesto de tiempo.
+    """
+
+    TOKENS = int(os.getenv("RAG_TOKENS", "400"))
+    KNOWLEDGE_K = int(os.getenv("RAG_KNOWLEDGE_K", "3"))
+    ARTICLES_K = int(os.getenv("RAG_ARTICLES_K", "5"))
+    ITEM_TOKENS = int(os.getenv("RAG_ITEM_TOKENS", "100"))
+    BUDGET_MS = float(os.getenv("RAG_BUDGET_MS", "5"))
+    # Mismo límite que la búsqueda de productos del chat: comparten la entrada del cache de búsquedas
+    SEARCH_LIMIT = 50
+
+    def __init__(self, hdl_service, counter: TokenCounter, knowledge: Optional[KnowledgeIndex] = None):
+        self.hdl_service = hdl_service
+        self.counter = counter
+        self.knowledge = knowledge if knowledge is not None else KnowledgeIndex()
+        self._lock = threading.Lock()
+        self._avg_ms: Optional[float] = None
+        self.stats = {
+            'calls': 0,
+            'knowledge_items': 0,
+            'articles': 0,
+            'catalog_skipped': 0,
+            'over_budget': 0,
+        }
+
+    def _resolve_lista(self, catalogo: CompactCatalog, lista: Optional[str]) -> Optional[str]:
+        """Código de lista del catálogo a partir de un código o parte del nombre"""
+        lista = (lista or '').strip()
+        if not lista:
+            return None
+        if lista in catalogo.col_by_lista:
+            return lista
+        wanted = lista.lower()
+        for codigo, nombre in zip(catalogo.lista_codigos, catalogo.lista_nombres):
+            if wanted == str(codigo).lower() or wanted in str(nombre).lower():
+                return codigo
+        return None
+
+    def context(self, message: str, facts: Optional[Dict] = None,
+                codigo_lista: Optional[str] = None) -> Optional[str]:
+        """Texto de contexto recuperado para el mensaje, o None si no hay nada relevante"""
+        if not message.strip() or self.TOKENS <= 0:
+            return None
+        started = time.perf_counter()
+        deadline = started + self.BUDGET_MS / 1000
+
+        # Hasta la mitad del presupuesto para conocimiento; el resto (y lo que sobre) para artículos
+        used = 0
+        knowledge_lines = []
+        for item in self.knowledge.search(message, self.KNOWLEDGE_K) if self.KNOWLEDGE_K > 0 else []:
+            line = self.counter.truncate(
+                f"- {item.get('title', '')}: {' '.join(str(item.get('content', '')).split())}", self.ITEM_TOKENS)
+            cost = self.counter.count(line)
+            if used + cost > self.TOKENS // 2:
+                break
+            knowledge_lines.append(line)
+            used += cost
+
+        article_lines, lista = [], None
+        catalogo = None
+        if self.ARTICLES_K > 0 and time.perf_counter() < deadline:
+            catalogo = self.hdl_service.peek_catalogo()
+        if catalogo is not None:
+            lista = self._resolve_lista(catalogo, codigo_lista or (facts or {}).get('lista'))
+            try:
+                articulos = self.hdl_service.search_articulos(message, self.SEARCH_LIMIT, fuzzy=True)
+            except Exception:
+                articulos = []
+            for articulo in articulos[:self.ARTICLES_K]:
+                line = f"- {articulo['codigo']} | {articulo['nombre']}"
+                if lista is not None:
+                    precio = catalogo.get_precio(articulo['codigo'], lista)
+                    line += f" | ${precio:,.2f}" if precio is not None else " | sin precio en la lista"
+                cost = self.counter.count(line)
+                if used + cost > self.TOKENS:
+                    break
+                article_lines.append(line)
+                used += cost
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['knowledge_items'] += len(knowledge_lines)
+            self.stats['articles'] += len(article_lines)
+            if catalogo is None and self.ARTICLES_K > 0:
+                self.stats['catalog_skipped'] += 1
+            if elapsed > self.BUDGET_MS:
+                self.stats['over_budget'] += 1
+            self._avg_ms = elapsed if self._avg_ms is None else 0.9 * self._avg_ms + 0.1 * elapsed
+
+        if not knowledge_lines and not article_lines:
+            return None
+        parts = ["Información recuperada del sistema (úsala sólo si es relevante; no inventes datos que no estén aquí)."]
+        if knowledge_lines:
+            parts.append("Base de conocimiento:\n" + "\n".join(knowledge_lines))
+        if article_lines:
+            header = "Artículos del catálogo (código | nombre"
+            header += f" | precio unitario sin IVA en la lista {lista}):" if lista is not None else "; sin lista de precios elegida):"
+            parts.append(header + "\n" + "\n".join(article_lines))
+        return "\n".join(parts)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics['avg_ms'] = round(self._avg_ms, 3) if self._avg_ms is not None else None
+        metrics.update({
+            'knowledge_size': len(self.knowledge),
+            'token_budget': self.TOKENS,
+            'budget_ms': self.BUDGET_MS,
+        })
+        return metrics
@@ -0,0 +1,393 @@
+import copy
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+_PUNCTUATION_RE = re.compile(r"[()\[\]{},;:/\\\"'¿?¡!*+#|_-]")
+_DIGIT_RE = re.compile(r'\d')
+_RANGE_RE = re.compile(r'\b(\d+)\s*a\s*(\d+)\b')
+_DIMENSION_RE = re.compile(r'(\d)\s*x\s*(?=\d)')
+# (patrón, reemplazo, subcadenas de las que depende): el patrón sólo se aplica si aparece alguna
+_UNITS = (
+    (re.compile(r'\b(?:x\s*)?(?:m3|mts?3|metros? cubicos?)\b'), ' m3 ', ('m3', 'mt', 'metro')),
+    (re.compile(r'\b(?:x\s*)?(?:m2|mts?2|metros? cuadrados?)\b'), ' m2 ', ('m2', 'mt', 'metro')),
+    (re.compile(r'(\d)\s*(?:kgs?|kilos?)\b'), r'\1kg', ('kg', 'kilo')),
+    (re.compile(r'(\d)\s*(?:mm|milimetros?)\b'), r'\1mm', ('mm', 'milim')),
+    (re.compile(r'(\d)\s*(?:lts?|litros?)\b'), r'\1l', ('lt', 'litro')),
+)
+# Palabras que no aportan a la búsqueda difusa de artículos
+STOPWORDS = {
+    'x', 'por', 'de', 'del', 'la', 'el', 'los', 'las', 'en', 'con', 'para', 'y', 'un', 'una',
+    'unos', 'unas', 'al', 'que', 'me', 'mi', 'necesito', 'quiero', 'precio', 'hola',
+}
+
+
+def fold_accents(text: str) -> str:
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize(text: str) -> str:
+    """
+    Normaliza texto de artículos y consultas: minúsculas, sin acentos ni puntuación,
+    rangos ("6 a 20" -> "6a20"), medidas ("12 x 18" -> "12x18") y unidades ("x m3", "50 kg" -> "m3", "50kg").
+    """
+    text = fold_accents((text or '').lower())
+    text = _PUNCTUATION_RE.sub(' ', text)
+    if _DIGIT_RE.search(text):
+        text = _RANGE_RE.sub(r'\1a\2', text)
+        if 'x' in text:
+            text = _DIMENSION_RE.sub(r'\1x', text)
+    for pattern, replacement, hints in _UNITS:
+        if any(hint in text for hint in hints):
+            text = pattern.sub(replacement, text)
+    return text
+
+
+def phonetic(word: str) -> str:
+    """Clave fonética simple del español rioplatense (ll/y, v/b, z/s/ce/ci, h muda)"""
+    word = word.replace('ll', 'y').replace('v', 'b').replace('z', 's')
+    word = re.sub(r'c(?=[ei])', 's', word)
+    word = re.sub(r'(?<!c)h', '', word)
+    return word
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def padded_trigrams(word: str) -> Set[str]:
+    return trigrams(f"$${word}$")
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Coeficiente de Dice entre dos conjuntos de trigramas"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _FieldIndex:
+    """
+    Vocabulario de un campo (nombre o código) con postings palabra -> documentos
+    y un índice de trigramas sobre el vocabulario para resolver subcadenas.
+    """
+
+    def __init__(self, exact_score: int, prefix_score: int, infix_score: int):
+        self.exact_score = exact_score
+        self.prefix_score = prefix_score
+        self.infix_score = infix_score
+        self.word_ids: Dict[str, int] = {}
+        self.words: List[str] = []
+        self.postings: List[array] = []
+        self.grams: Dict[str, Set[int]] = {}
+        # Trigramas (con relleno) de la clave fonética de cada palabra, para búsqueda difusa
+        self._fuzzy_grams: Optional[Dict[str, Set[int]]] = None
+        self._fuzzy_word_grams: List[Set[str]] = []
+        # En una copia (ver copy()) registran qué postings/trigramas ya no se comparten con el original
+        self._owned_postings: Optional[Set[int]] = None
+        self._owned_grams: Optional[Set[str]] = None
+
+    def copy(self) -> '_FieldIndex':
+        """Copia liviana que comparte postings y trigramas con el original hasta modificarlos"""
+        clone = copy.copy(self)
+        clone.word_ids = dict(self.word_ids)
+        clone.words = list(self.words)
+        clone.postings = list(self.postings)
+        clone.grams = dict(self.grams)
+        clone._owned_postings = set()
+        clone._owned_grams = set()
+        return clone
+
+    def add(self, doc_id: int, text: str):
+        for word in set(text.split()):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+                self.postings.append(array('i'))
+                self._fuzzy_grams = None
+                if self._owned_postings is not None:
+                    self._owned_postings.add(word_id)
+                for gram in trigrams(word):
+                    word_ids = self.grams.get(gram)
+                    if word_ids is None:
+                        word_ids = self.grams[gram] = set()
+                        if self._owned_grams is not None:
+                            self._owned_grams.add(gram)
+                    elif self._owned_grams is not None and gram not in self._owned_grams:
+                        word_ids = self.grams[gram] = set(word_ids)
+                        self._owned_grams.add(gram)
+                    word_ids.add(word_id)
+            elif self._owned_postings is not None and word_id not in self._owned_postings:
+                self.postings[word_id] = array('i', self.postings[word_id])
+                self._owned_postings.add(word_id)
+            self.postings[word_id].append(doc_id)
+
+    def _words_containing(self, term: str) -> Iterable[int]:
+        grams = trigrams(term)
+        if not grams:
+            # Términos de 1-2 caracteres: se recorre el vocabulario (es chico frente a los documentos)
+            return [word_id for word_id, word in enumerate(self.words) if term in word]
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.grams.get(g, ()))):
+            ids = self.grams.get(gram)
+            if not ids:
+                return ()
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return ()
+        return (word_id for word_id in candidates if term in self.words[word_id])
+
+    def build_fuzzy_index(self):
+        fuzzy_grams: Dict[str, Set[int]] = {}
+        fuzzy_word_grams = []
+        for word_id, word in enumerate(self.words):
+            grams = padded_trigrams(phonetic(word))
+            fuzzy_word_grams.append(grams)
+            for gram in grams:
+                fuzzy_grams.setdefault(gram, set()).add(word_id)
+        self._fuzzy_word_grams = fuzzy_word_grams
+        self._fuzzy_grams = fuzzy_grams
+
+    def _similar_words(self, term: str, threshold: float, max_expansions: int = 30) -> List[Tuple[int, float]]:
+        """Palabras del vocabulario parecidas al término (tolerando errores de tipeo), las más parecidas primero"""
+        if self._fuzzy_grams is None:
+            self.build_fuzzy_index()
+
+        term_grams = padded_trigrams(phonetic(term))
+        shared = Counter()
+        for gram in term_grams:
+            shared.update(self._fuzzy_grams.get(gram, ()))
+        # Cota superior de Dice para descartar candidatos sin calcular la similitud completa
+        min_shared = threshold * len(term_grams) / 2
+        result = []
+        for word_id, count in shared.items():
+            if count < min_shared:
+                continue
+            sim = similarity(term_grams, self._fuzzy_word_grams[word_id])
+            if sim >= threshold:
+                result.append((word_id, sim))
+        result.sort(key=lambda item: -item[1])
+        return result[:max_expansions]
+
+    def score_term(self, term: str, scores: np.ndarray, fuzzy_threshold: Optional[float] = None,
+                   exact_only: bool = False):
+        """
+        Acumula en scores (por documento) el mejor puntaje del término en este campo.
+        Con fuzzy_threshold también puntúan (con menor peso) las palabras parecidas;
+        con exact_only sólo puntúan las palabras idénticas al término.
+        """
+        by_score: Dict[float, List[array]] = {}
+        if exact_only:
+            word_id = self.word_ids.get(term)
+            words = () if word_id is None else (word_id,)
+        else:
+            words = self._words_containing(term)
+        for word_id in words:
+            word = self.words[word_id]
+            if word == term:
+                score = self.exact_score
+            elif word.startswith(term):
+                score = self.prefix_score
+            else:
+                score = self.infix_score
+            by_score.setdefault(score, []).append(self.postings[word_id])
+        if fuzzy_threshold is not None and len(term) >= 3:
+            for word_id, sim in self._similar_words(term, fuzzy_threshold):
+                score = round(self.prefix_score * sim, 2)
+                by_score.setdefault(score, []).append(self.postings[word_id])
+        for score, postings in by_score.items():
+            if len(postings) == 1:
+                docs = np.frombuffer(postings[0], dtype=np.int32)
+            else:
+                docs = np.concatenate([np.frombuffer(p, dtype=np.int32) for p in postings])
+            scores[docs] = np.maximum(scores[docs], score)
+
+
+class TrigramIndex:
+    """
+    Índice invertido por palabras, con trigramas sobre el vocabulario, para buscar
+    documentos (clave, nombre, código) por subcadena y múltiples términos.
+    Un término coincide si es subcadena de alguna palabra del nombre o del código;
+    el puntaje distingue coincidencia exacta, por prefijo o interna.
+    """
+
+    def __init__(self, docs: Iterable[Tuple[str, str, str]] = ()):
+        # Las claves eliminadas por patched() quedan en None hasta la próxima reconstrucción
+        self.keys: List[Optional[str]] = []
+        self.id_by_key: Dict[str, int] = {}
+        # Nombre normalizado de cada documento (None si fue eliminado), reutilizable por otros índices
+        self.normalized: List[Optional[str]] = []
+        self.nombre = _FieldIndex(exact_score=30, prefix_score=20, infix_score=10)
+        self.codigo = _FieldIndex(exact_score=100, prefix_score=50, infix_score=5)
+        lengths = array('i')
+        self._add_docs(docs, lengths)
+        self.lengths = np.frombuffer(lengths, dtype=np.int32)
+        self.alive = np.ones(len(self.keys), dtype=bool)
+        self.nombre.build_fuzzy_index()
+
+    def _add_docs(self, docs: Iterable[Tuple[str, str, str]], lengths: array):
+        for key, nombre, codigo in docs:
+            if key in self.id_by_key:
+                continue
+            doc_id = len(self.keys)
+            self.id_by_key[key] = doc_id
+            self.keys.append(key)
+            nombre = normalize(nombre)
+            self.normalized.append(nombre)
+            lengths.append(len(nombre))
+            self.nombre.add(doc_id, nombre)
+            self.codigo.add(doc_id, normalize(codigo))
+
+    def __len__(self) -> int:
+        return len(self.id_by_key)
+
+    @property
+    def dead_ratio(self) -> float:
+        """Fracción de documentos eliminados que todavía ocupan lugar en los postings"""
+        return 1 - len(self.id_by_key) / len(self.keys) if self.keys else 0.0
+
+    def patched(self, removed: Iterable[str], added: Iterable[Tuple[str, str, str]]) -> 'TrigramIndex':
+        """
+        Devuelve un índice nuevo con los documentos eliminados/agregados, sin modificar este
+        (que puede seguir en uso por otros hilos). Sólo se copian los postings afectados.
+        """
+        index = TrigramIndex.__new__(TrigramIndex)
+        index.keys = list(self.keys)
+        index.id_by_key = dict(self.id_by_key)
+        index.normalized = list(self.normalized)
+        index.nombre = self.nombre.copy()
+        index.codigo = self.codigo.copy()
+        alive = self.alive.copy()
+        for key in removed:
+            doc_id = index.id_by_key.pop(key, None)
+            if doc_id is not None:
+                index.keys[doc_id] = None
+                index.normalized[doc_id] = None
+                alive[doc_id] = False
+
+        lengths = array('i')
+        lengths.frombytes(self.lengths.tobytes())
+        first_new = len(index.keys)
+        index._add_docs(added, lengths)
+        index.lengths = np.frombuffer(lengths, dtype=np.int32)
+        index.alive = np.concatenate([alive, np.ones(len(index.keys) - first_new, dtype=bool)])
+        if index.nombre._fuzzy_grams is None:
+            index.nombre.build_fuzzy_index()
+        return index
+
+    def search(self, query: str, limit: Optional[int] = None, fuzzy: bool = False,
+               fuzzy_threshold: float = 0.5) -> List[Tuple[str, float]]:
+        """
+        Devuelve [(clave, puntaje)] de los documentos que contienen todos los términos
+        (en nombre o código), ordenados por calidad de coincidencia.
+        En modo difuso se ignoran palabras vacías, se toleran errores de tipeo y alcanza
+        con que coincida algún término (se ordena primero por cantidad de términos coincidentes).
+        """
+        terms = list(dict.fromkeys(normalize(query).split()))
+        if fuzzy:
+            terms = [term for term in terms if term not in STOPWORDS] or terms
+        if not terms or not self.keys:
+            return []
+
+        total = np.zeros(len(self.keys), dtype=np.float64)
+        matched = self.alive.copy()
+        matched_terms = np.zeros(len(self.keys), dtype=np.int32)
+        for term in terms:
+            scores = np.zeros(len(self.keys), dtype=np.float64)
+            self.nombre.score_term(term, scores, fuzzy_threshold if fuzzy else None)
+            # En texto libre los números suelen ser cantidades: el código sólo cuenta si es exacto
+            self.codigo.score_term(term, scores, exact_only=fuzzy)
+            if fuzzy:
+                matched_terms += scores > 0
+            else:
+                matched &= scores > 0
+                if not matched.any():
+                    return []
+            total += scores
+
+        if fuzzy:
+            doc_ids = np.flatnonzero((matched_terms > 0) & self.alive)
+            primary = -matched_terms[doc_ids]
+        else:
+            doc_ids = np.flatnonzero(matched)
+            primary = np.zeros(len(doc_ids), dtype=np.int32)
+        # A igual puntaje se prefieren nombres más cortos (más específicos) y luego el orden del catálogo
+        order = np.lexsort((doc_ids, self.lengths[doc_ids], -total[doc_ids], primary))
+        if limit is not None:
+            order = order[:limit]
+        return [(self.keys[doc_ids[i]], float(total[doc_ids[i]])) for i in order]
+
+
+def compact_key(text: str) -> str:
+    """Clave sin separadores para códigos y CUIT ("20-12345678-9" -> "20123456789")"""
+    if text.isascii() and text.isalnum():
+        return text.lower()
+    return ''.join(ch for ch in normalize(text) if ch.isalnum())
+
+
+class PrefixIndex:
+    """
+    Índice de autocompletado: arreglo ordenado de (término, documento) con búsqueda binaria.
+    Cada documento aporta las palabras de su etiqueta y claves compactas (códigos, CUIT).
+    Con normalized=True las etiquetas ya vienen normalizadas (p. ej. desde un TrigramIndex).
+    El último término de la consulta se busca como prefijo; los anteriores deben ser
+    prefijos de alguna palabra de la etiqueta.
+    """
+
+    # Tope de entradas recorridas por consulta (prefijos muy cortos coinciden con casi todo)
+    MAX_CANDIDATES = 1000
+
+    def __init__(self, docs: Iterable[Tuple[Any, str, Iterable[str]]] = (), normalized: bool = False):
+        self.payloads: List[Any] = []
+        # Etiqueta normalizada con un espacio inicial, para comparar inicios de palabra
+        self.labels: List[str] = []
+        pairs = []
+        for payload, label, keys in docs:
+            doc_id = len(self.payloads)
+            words = (label if normalized else normalize(label)).split()
+            self.payloads.append(payload)
+            self.labels.append(' ' + ' '.join(words))
+            terms = set(words)
+            terms.update(compact_key(key) for key in keys if key)
+            terms.discard('')
+            pairs.extend((sys.intern(term), doc_id) for term in terms)
+        pairs.sort()
+        self.terms = [term for term, _ in pairs]
+        self.doc_ids = array('i', [doc_id for _, doc_id in pairs])
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def complete(self, query: str, limit: int = 8) -> List[Any]:
+        """Documentos cuyo texto empieza (por palabra) con la consulta, los más cortos primero"""
+        if not any(ch.isalpha() for ch in query or ''):
+            # Sólo números y separadores: se trata como un código o CUIT completo
+            tokens = [compact_key(query or '')]
+        else:
+            tokens = normalize(query).split()
+        if not tokens or not tokens[-1]:
+            return []
+        *previous, last = tokens
+        previous = [' ' + term for term in previous]
+        start = bisect_left(self.terms, last)
+        end = min(bisect_left(self.terms, last + '\uffff'), start + self.MAX_CANDIDATES)
+        candidates = {}
+        for i in range(start, end):
+            doc_id = self.doc_ids[i]
+            if doc_id not in candidates and all(term in self.labels[doc_id] for term in previous):
+                candidates[doc_id] = None
+        phrase = ' ' + ' '.join(tokens)
+        ranked = sorted(candidates, key=lambda doc_id: (
+            not self.labels[doc_id].startswith(phrase), len(self.labels[doc_id]), doc_id))
+        return [self.payloads[doc_id] for doc_id in ranked[:limit]]
@@ -1,13 +1,14 @@
 import json
 import random
 from typing import Dict, List, Optional, Any
-from src.services.hdl_api import HDLApiService
+from src.services.hdl_api import get_hdl_service
+from src.services.intent_classifier import INTENT_KEYWORDS, PRODUCT_SEARCH_KEYWORDS
 
 class SimpleAIService:
     """Servicio de IA simplificado para desarrollo sin dependencias externas"""
     
     def __init__(self):
-        self.hdl_service = HDLApiService()
+        self.hdl_service = get_hdl_service()
         
         # Respuestas predefinidas para diferentes tipos de consultas
         self.responses = {
@@ -83,7 +84,7 @@ class SimpleAIService:
         Busca productos en el catálogo HDL
         """
         try:
-            return self.hdl_service.search_articulos(query)
+            return self.hdl_service.search_articulos(query, fuzzy=True)
         except Exception as e:
             return []
     
@@ -139,16 +140,10 @@ que sean suficientes para tu obra específica.
         """
         Clasifica el tipo de mensaje para generar una respuesta apropiada
         """
-        if any(word in message for word in ['hola', 'buenos', 'buenas', 'saludos']):
-            return 'greeting'
-        elif any(word in message for word in ['cemento', 'cal', 'yeso']):
-            return 'cement'
-        elif any(word in message for word in ['casa', 'vivienda', 'm2', 'metros']):
-            return 'house'
-        elif any(word in message for word in ['material', 'producto', 'articulo', 'precio']):
-            return 'materials'
-        else:
-            return 'default'
+        for response_type in ('greeting', 'cement', 'house', 'materials'):
+            if any(word in message for word in INTENT_KEYWORDS[response_type]):
+                return response_type
+        return 'default'
     
     def _get_quick_replies(self, message: str, response_type: str) -> List[str]:
         """
@@ -169,13 +164,7 @@ que sean suficientes para tu obra específica.
         """
         Determina si se necesita buscar productos
         """
-        search_keywords = [
-            'cemento', 'cal', 'yeso', 'ladrillo', 'bloque', 'arena',
-            'piedra', 'adhesivo', 'klaukol', 'material', 'producto',
-            'precio', 'costo', 'cuanto', 'disponible'
-        ]
-        
-        return any(keyword in message for keyword in search_keywords)
+        return any(keyword in message for keyword in PRODUCT_SEARCH_KEYWORDS)
     
     def _determine_next_step(self, message: str, response_type: str) -> str:
         """
@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# Los módulos se importan como src.services..., igual que desde src/main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('HDL_REFRESH_SCHEDULER', 'false')
+
+from src.services import hdl_api  # noqa: E402
+
+
+def catalog_payload(articulos=None, resultado=1):
+    """Respuesta de la operación 3 con los artículos dados (por defecto, tres de prueba)"""
+    if articulos is None:
+        articulos = [
+            {'codigo': 'A1', 'nombre': 'CEMENTO 50 KG', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '100.5'}]},
+            {'codigo': 'A2', 'nombre': 'ARENA X M3', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '2000'}]},
+            {'codigo': 'A3', 'nombre': 'CAL HIDRATADA 25 KG', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '50'}]},
+        ]
+    return {'resultado': resultado, 'articulos': articulos}
+
+
+class FakeHDL:
+    """
+    Web service de HDL de prueba: responde cada operación con el cuerpo configurado,
+    con ETag (y 304 ante If-None-Match) y una demora opcional
+    """
+
+    def __init__(self):
+        self.bodies = {3: json.dumps(catalog_payload()).encode()}
+        self.status = 200
+        self.etag = None
+        self.delay = 0.0
+        self.requests = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                operacion = int(parse_qs(urlparse(self.path).query)['operacion'][0])
+                with fake._lock:
+                    fake.requests.append((operacion, dict(self.headers)))
+                time.sleep(fake.delay)
+                try:
+                    if fake.etag and self.headers.get('If-None-Match') == fake.etag:
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    body = fake.bodies.get(operacion, b'{"resultado": 0}')
+                    self.send_response(fake.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    if fake.etag:
+                        self.send_header('ETag', fake.etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/ws_web.php'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def set_catalog(self, articulos=None, resultado=1):
+        self.bodies[3] = json.dumps(catalog_payload(articulos, resultado)).encode()
+
+    def calls(self, operacion):
+        with self._lock:
+            return [headers for op, headers in self.requests if op == operacion]
+
+
+@pytest.fixture
+def fake_hdl():
+    fake = FakeHDL()
+    yield fake
+    fake.server.shutdown()
+    fake.server.server_close()
+
+
+@pytest.fixture
+def make_service(fake_hdl, tmp_path, monkeypatch):
+    """Crea HDLApiService contra el upstream de prueba, con snapshots en un directorio temporal"""
+    monkeypatch.setattr(hdl_api.HDLApiService, 'BASE_URL', fake_hdl.url)
+    monkeypatch.setattr(hdl_api.HDLApiService, 'CACHE_DIR', str(tmp_path / 'hdl_cache'))
+    monkeypatch.delenv('USE_MOCK_DATA', raising=False)
+    services = []
+
+    def make():
+        service = hdl_api.HDLApiService()
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.stop_refresh_scheduler()
+
+
+@pytest.fixture
+def request_budget():
+    """Fija el presupuesto de tiempo del request (como main.py) y lo restablece al terminar"""
+    tokens = []
+
+    def set_budget(seconds):
+        tokens.append(hdl_api.set_request_deadline(seconds))
+
+    yield set_budget
+    for token in reversed(tokens):
+        hdl_api.reset_request_deadline(token)
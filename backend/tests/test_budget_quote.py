@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src.services.catalog import CompactCatalog
+from tests.conftest import catalog_payload
+
+
+def test_quote_budget_totals(fake_hdl, make_service):
+    quote = make_service().quote_budget('1', [
+        {'codigo': 'A1', 'cantidad': 2},
+        {'codigo': 'A2', 'cantidad': '1.5'},
+        {'codigo': 'NOEXISTE', 'cantidad': 1},
+    ])
+
+    assert [line['total'] for line in quote['items']] == [201.0, 3000.0, 0.0]
+    assert quote['subtotal'] == 3201.0
+    assert quote['iva'] == 672.21
+    assert quote['total'] == 3873.21
+    assert quote['sin_precio'] == 1
+
+
+@pytest.mark.parametrize('items', [
+    [{'codigo': 'A2', 'cantidad': 1e308}, {'codigo': 'A2', 'cantidad': 1e308}],
+    [{'codigo': 'A1', 'cantidad': 1e307}, {'codigo': 'A2', 'cantidad': 1e306}],
+    [{'codigo': 'A2', 'cantidad': 1e306}],
+])
+def test_quote_budget_rejects_totals_that_overflow(fake_hdl, make_service, items):
+    with pytest.raises(OverflowError):
+        make_service().quote_budget('1', items)
+
+
+def test_compare_listas_obra_rejects_totals_that_overflow(fake_hdl, make_service):
+    fake_hdl.bodies[1] = json.dumps({'resultado': 1, 'clientes': [{
+        'datos': {'cuit': '1', 'razon_social': 'ACME'},
+        'obras': [{'codigo': 'OB1', 'nombre': 'Obra 1', 'listas': [{'codigo': '1', 'nombre': 'Lista 1'}]}],
+    }]}).encode()
+    service = make_service()
+    assert service.compare_listas_obra('OB1', [{'codigo': 'A1', 'cantidad': 1}])['listas'][0]['total'] == 121.61
+
+    with pytest.raises(OverflowError):
+        service.compare_listas_obra('OB1', [{'codigo': 'A2', 'cantidad': 1e308}, {'codigo': 'A2', 'cantidad': 1e308}])
+
+
+@pytest.mark.parametrize('cantidad', ['nan', 'inf', '-inf'])
+def test_quote_budget_rejects_non_finite_quantities(fake_hdl, make_service, cantidad):
+    with pytest.raises(ValueError):
+        make_service().quote_budget('1', [{'codigo': 'A1', 'cantidad': cantidad}])
+
+
+def test_non_finite_upstream_prices_are_ignored():
+    catalogo = CompactCatalog.from_payload(catalog_payload([
+        {'codigo': 'A1', 'nombre': 'CEMENTO', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': 'inf'}]},
+    ]))
+    assert catalogo.get_precio('A1', '1') is None
@@ -0,0 +1,73 @@
+import threading
+
+from src.services.budget_summaries import BudgetSummaryService, budget_fingerprint
+
+ITEMS = [{'codigo': 'A1', 'nombre': 'Cemento', 'cantidad': 2, 'precio_unitario': 100.5, 'total': 201}]
+
+
+def _service(generate):
+    service = BudgetSummaryService(generate, version='test')
+    service.INLINE_WAIT = 0
+    return service
+
+
+def test_summary_is_generated_once_and_cached():
+    calls = []
+    service = _service(lambda items: calls.append(items) or {'summary': 'Resumen'})
+
+    summary_id, result = service.request(ITEMS)
+    assert service.wait(summary_id, 5) == {'summary': 'Resumen'}
+    assert service.request(list(reversed(ITEMS))) == (summary_id, {'status': 'ready', 'summary': {'summary': 'Resumen'}})
+    assert len(calls) == 1
+    assert service.get_metrics()['cache_hits'] == 1
+
+
+def test_concurrent_requests_share_one_generation():
+    release = threading.Event()
+    calls = []
+
+    def generate(items):
+        calls.append(items)
+        release.wait(5)
+        return {'summary': 'Resumen'}
+
+    service = _service(generate)
+    results = [service.request(ITEMS) for _ in range(5)]
+    release.set()
+
+    assert {status['status'] for _, status in results} == {'pending'}
+    assert service.wait(results[0][0], 5) == {'summary': 'Resumen'}
+    assert len(calls) == 1
+    assert service.get_metrics()['coalesced'] == 4
+
+
+def test_generation_finishing_before_the_lock_is_not_repeated():
+    calls = []
+    service = _service(lambda items: calls.append(items) or {'summary': 'Otro'})
+    summary_id = budget_fingerprint(ITEMS)
+    cache_get = service.cache.get
+
+    def racing_get(key, version):
+        # La generación en curso termina justo después de la consulta sin lock
+        summary = cache_get(key, version)
+        service.cache.get = cache_get
+        service.cache.set(summary_id, 'test', {'summary': 'Resumen'})
+        return summary
+
+    service.cache.get = racing_get
+    assert service.request(ITEMS) == (summary_id, {'status': 'ready', 'summary': {'summary': 'Resumen'}})
+    assert calls == []
+    assert service.get_metrics()['pending'] == 0
+
+
+def test_failed_summary_is_retried_by_a_new_request():
+    responses = [{'summary': ''}, {'summary': 'Resumen'}]
+    service = _service(lambda items: responses.pop(0))
+
+    summary_id, _ = service.request(ITEMS)
+    service.wait(summary_id, 5)
+    assert service.get(summary_id)['status'] == 'failed'
+
+    service.request(ITEMS)
+    assert service.wait(summary_id, 5) == {'summary': 'Resumen'}
+    assert service.get(summary_id)['status'] == 'ready'
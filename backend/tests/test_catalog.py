@@ -0,0 +1,62 @@
+import json
+
+from src.services.catalog import CompactCatalog
+from tests.conftest import catalog_payload
+
+
+def _articulo(codigo, nombre, precio='100.000', lista_nombre='Lista 1', **extra):
+    articulo = {'codigo': codigo, 'nombre': nombre, 'codigoint': extra.pop('codigoint', ''),
+                'precios': [{'codigo': '1', 'nombre': lista_nombre, 'precio': precio}]}
+    articulo.update(extra)
+    return articulo
+
+
+def test_to_dict_keeps_upstream_price_text():
+    catalogo = CompactCatalog.from_payload(catalog_payload())
+
+    assert [a['precios'][0]['precio'] for a in catalogo.to_payload()['articulos']] == ['100.5', '2000', '50']
+    assert catalogo.get_precio('A1', '1') == 100.5
+
+
+def test_to_dict_round_trips_through_columns():
+    catalogo = CompactCatalog.from_payload(catalog_payload([
+        _articulo('A1', 'CEMENTO', precio='79794.368'),
+        _articulo('A2', 'ARENA', precio='1.5'),
+    ]))
+    columns = json.loads(json.dumps(catalogo.to_columns()))
+    restored = CompactCatalog.from_columns(columns, catalogo.precios)
+
+    assert restored.to_payload() == catalogo.to_payload()
+    # Los precios con 3 decimales no se guardan aparte
+    assert list(catalogo.precio_textos) == [1]
+
+
+def test_diff_reports_extras_codigoint_and_list_names():
+    previous = CompactCatalog.from_payload(catalog_payload([
+        _articulo('A1', 'CEMENTO', codigoint='10', unidad='BOLSA'),
+        _articulo('A2', 'ARENA', codigoint='20'),
+    ]))
+    current = CompactCatalog.from_payload(catalog_payload([
+        _articulo('A1', 'CEMENTO', codigoint='10', unidad='PALLET', lista_nombre='Mayorista'),
+        _articulo('A2', 'ARENA', codigoint='21', lista_nombre='Mayorista'),
+    ]), previous=previous)
+
+    changes = current.changes.to_dict()
+    assert changes['updated'] == [
+        {'codigo': 'A1', 'codigoint': '10', 'extras': {'unidad': 'PALLET'}},
+        {'codigo': 'A2', 'codigoint': '21', 'extras': {}},
+    ]
+    assert changes['listas'] == [{'codigo': '1', 'nombre': 'Mayorista'}]
+    assert not (changes['added'] or changes['removed'] or changes['renamed'] or changes['repriced'])
+    # El autocompletado se rearma para reflejar el codigoint nuevo
+    assert current.autocomplete_index is not previous.autocomplete_index
+    assert current.autocomplete('21') == [{'codigo': 'A2', 'nombre': 'ARENA'}]
+
+
+def test_diff_of_identical_catalogs_is_empty():
+    previous = CompactCatalog.from_payload(catalog_payload())
+    current = CompactCatalog.from_payload(catalog_payload(), previous=previous)
+
+    assert current.changes.is_empty()
+    assert current.search_index is previous.search_index
+    assert current.autocomplete_index is previous.autocomplete_index
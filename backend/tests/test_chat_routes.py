@@ -0,0 +1,103 @@
+import importlib
+import json
+
+import pytest
+from flask import Flask, g
+
+from src.services import hdl_api
+
+
+@pytest.fixture
+def chat(fake_hdl, make_service, monkeypatch):
+    """Módulo de rutas de chat usando el HDL de prueba"""
+    # El servicio de IA exige una clave al construirse; el modelo no se llama en estos tests
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    module = importlib.import_module('src.routes.chat')
+    monkeypatch.setattr(module, 'hdl_service', make_service())
+    return module
+
+
+@pytest.fixture
+def client(chat):
+    """Cliente de Flask con el blueprint de chat y el presupuesto por request de main.py"""
+    app = Flask(__name__)
+    app.register_blueprint(chat.chat_bp, url_prefix='/api/chat')
+
+    @app.before_request
+    def start_request_budget():
+        g.hdl_deadline_token = hdl_api.set_request_deadline(5)
+
+    @app.teardown_request
+    def end_request_budget(exc):
+        token = g.pop('hdl_deadline_token', None)
+        if token is not None:
+            hdl_api.reset_request_deadline(token)
+
+    return app.test_client()
+
+
+def test_autocomplete_default_limit(client):
+    response = client.get('/api/chat/autocomplete?q=c')
+    assert response.status_code == 200
+    assert [a['codigo'] for a in response.get_json()['articulos']] == ['A1', 'A3']
+
+
+def test_autocomplete_caps_limit(client):
+    response = client.get('/api/chat/autocomplete?q=a&limit=99999999999999999999999')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('limit', ['0', '-5', 'abc', '1.5'])
+def test_autocomplete_rejects_invalid_limit(client, limit):
+    response = client.get(f'/api/chat/autocomplete?q=a&limit={limit}')
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+
+def test_search_products_pages_with_cursor(client):
+    first = client.post('/api/chat/search-products', json={'query': 'a', 'limit': 2}).get_json()
+    assert first['total'] == 3 and len(first['products']) == 2
+
+    second = client.post('/api/chat/search-products', json={'query': 'a', 'limit': 2, 'cursor': first['next_cursor']})
+    assert second.status_code == 200
+    assert len(second.get_json()['products']) == 1
+    assert second.get_json()['next_cursor'] is None
+
+
+@pytest.mark.parametrize('body', [
+    {'query': 'a', 'limit': 0},
+    {'query': 'a', 'limit': 'diez'},
+    {'query': 'a', 'cursor': 'no-es-un-cursor'},
+])
+def test_search_products_rejects_invalid_pagination(client, body):
+    response = client.post('/api/chat/search-products', json=body)
+    assert response.status_code == 400
+
+
+def test_search_products_without_terms_is_empty(client):
+    response = client.post('/api/chat/search-products', json={'query': '!!!'})
+    assert response.status_code == 200
+    assert response.get_json() == {'products': [], 'total': 0, 'next_cursor': None}
+
+
+def test_streamed_searches_run_within_the_request_budget(chat, client, monkeypatch):
+    budgets = []
+
+    def search_products(message):
+        budgets.append(hdl_api._remaining_budget())
+        return [{'codigo': 'A1'}]
+
+    def process_message_stream(message, history, files, codigo_lista):
+        yield 'token', 'Hola'
+        yield 'result', {'response': 'Hola', 'needs_product_search': True}
+
+    monkeypatch.setattr(chat.ai_service, 'search_products', search_products)
+    monkeypatch.setattr(chat.ai_service, 'process_message_stream', process_message_stream)
+
+    response = client.post('/api/chat/message/stream', json={'message': 'cemento'})
+    events = [block.split('\n') for block in response.get_data(as_text=True).split('\n\n') if block.startswith('event:')]
+
+    assert [lines[0] for lines in events] == [
+        'event: token', 'event: message', 'event: products', 'event: clients', 'event: done']
+    assert json.loads(events[2][1][len('data: '):]) == {'products': [{'codigo': 'A1'}]}
+    assert budgets and budgets[0] is not None and 0 < budgets[0] <= 5
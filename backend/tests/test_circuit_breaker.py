@@ -0,0 +1,67 @@
+import time
+
+from src.services.circuit_breaker import CircuitBreaker
+
+
+def _breaker(**kwargs):
+    options = {'failure_rate': 0.5, 'window': 4, 'min_calls': 4, 'open_seconds': 0.1}
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def test_opens_when_failure_rate_reaches_threshold():
+    breaker = _breaker()
+    for record in (breaker.record_success, breaker.record_failure, breaker.record_success):
+        assert breaker.allow()
+        record()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.get_metrics()['rejected'] == 1
+    assert breaker.get_metrics()['retry_in'] > 0
+
+
+def test_stays_closed_below_min_calls():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_a_single_probe_through_and_closes_on_success():
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    time.sleep(0.12)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_metrics()['window_calls'] == 1
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    time.sleep(0.12)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_metrics()['opened'] == 2
+
+
+def test_release_frees_the_probe_without_a_result():
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    time.sleep(0.12)
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
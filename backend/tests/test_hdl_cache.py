@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+from tests.conftest import catalog_payload
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            raise AssertionError('timeout esperando la condición')
+        time.sleep(0.01)
+
+
+def _expire(service, operacion):
+    cache_key = f"operacion_{operacion}"
+    data, _ = service.cache[cache_key]
+    service.cache[cache_key] = (data, time.time() - service.cache_ttls[operacion] - 1)
+
+
+def test_conditional_get_sends_etag_and_renews_on_304(fake_hdl, make_service):
+    fake_hdl.etag = '"v1"'
+    service = make_service()
+    catalogo = service.get_catalogo()
+    assert 'If-None-Match' not in fake_hdl.calls(3)[0]
+
+    _expire(service, 3)
+    os.utime(service._snapshot_path(3), (0, 0))
+    assert service._refresh(3) is catalogo
+
+    assert fake_hdl.calls(3)[-1]['If-None-Match'] == '"v1"'
+    assert service.stats['not_modified'] == 1
+    assert service._get_cached_data('operacion_3') is catalogo
+    assert os.path.getmtime(service._snapshot_path(3)) > 0
+
+
+def test_conditional_get_downloads_when_etag_changes(fake_hdl, make_service):
+    fake_hdl.etag = '"v1"'
+    service = make_service()
+    version = service.get_catalogo().version
+
+    fake_hdl.etag = '"v2"'
+    fake_hdl.set_catalog(catalog_payload()['articulos'] + [
+        {'codigo': 'A4', 'nombre': 'LADRILLO HUECO', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '10'}]},
+    ])
+    _expire(service, 3)
+    service._refresh(3)
+
+    assert service.stats['not_modified'] == 0
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3', 'A4']
+    assert service.get_catalogo().version > version
+    assert service.validators[3]['etag'] == '"v2"'
+
+
+def test_validators_survive_a_restart(fake_hdl, make_service):
+    fake_hdl.etag = '"v1"'
+    make_service().get_catalogo()
+
+    restarted = make_service()
+    _expire(restarted, 3)
+    restarted._refresh(3)
+
+    assert fake_hdl.calls(3)[-1]['If-None-Match'] == '"v1"'
+    assert restarted.stats['not_modified'] == 1
+
+
+def test_stale_hit_serves_old_data_and_refreshes_in_background(fake_hdl, make_service):
+    service = make_service()
+    old = service.get_catalogo()
+    _expire(service, 3)
+    fake_hdl.set_catalog(catalog_payload()['articulos'][:2] + [
+        {'codigo': 'A9', 'nombre': 'PIEDRA PARTIDA', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '7'}]},
+    ])
+    fake_hdl.delay = 0.3
+
+    started = time.monotonic()
+    assert service.get_catalogo() is old
+    assert time.monotonic() - started < 0.2
+    assert service.stats['stale_hits'] == 1
+
+    _wait_for(lambda: service.get_catalogo() is not old)
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A9']
+    assert len(fake_hdl.calls(3)) == 2
+
+
+def test_concurrent_stale_hits_start_a_single_refresh(fake_hdl, make_service):
+    service = make_service()
+    old = service.get_catalogo()
+    _expire(service, 3)
+    fake_hdl.delay = 0.3
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_catalogo())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result is old for result in results)
+    _wait_for(lambda: service._get_cached_data('operacion_3') is not None)
+    assert len(fake_hdl.calls(3)) == 2
+
+
+def test_single_flight_wait_returns_the_refreshed_data(fake_hdl, make_service, monkeypatch):
+    monkeypatch.setenv('HDL_SINGLE_FLIGHT_WAIT', '5')
+    service = make_service()
+    service.get_catalogo()
+    _expire(service, 3)
+    fake_hdl.set_catalog(catalog_payload()['articulos'][:2] + [
+        {'codigo': 'A9', 'nombre': 'PIEDRA PARTIDA', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '7'}]},
+    ])
+    fake_hdl.delay = 0.1
+
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A9']
+    assert service.stats['wait_timeouts'] == 0
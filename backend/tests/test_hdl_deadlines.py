@@ -0,0 +1,117 @@
+import fcntl
+import os
+import time
+
+import pytest
+
+from src.services.mock_data import MOCK_ARTICULOS
+
+
+@pytest.fixture
+def breaker_env(monkeypatch):
+    monkeypatch.setenv('HDL_BREAKER_MIN_CALLS', '2')
+    monkeypatch.setenv('HDL_BREAKER_WINDOW', '2')
+    monkeypatch.setenv('HDL_BREAKER_OPEN_SECONDS', '0.2')
+
+
+def test_upstream_errors_open_the_breaker_and_serve_the_snapshot(fake_hdl, make_service, breaker_env):
+    service = make_service()
+    catalogo = service.get_catalogo()
+
+    fake_hdl.status = 500
+    assert service._refresh(3) is None
+    # Ventana de 2 llamadas: un éxito y una falla alcanzan la tasa de 0.5
+    assert service.breaker.state == 'open'
+
+    calls = len(fake_hdl.calls(3))
+    assert service._refresh(3) is None
+    assert len(fake_hdl.calls(3)) == calls
+    assert service.stats['breaker_rejections'] == 1
+    assert service.get_catalogo() is catalogo
+
+
+def test_probe_after_open_seconds_closes_the_breaker(fake_hdl, make_service, breaker_env):
+    service = make_service()
+    service.get_catalogo()
+    fake_hdl.status = 500
+    service._refresh(3)
+    assert service.breaker.state == 'open'
+
+    fake_hdl.status = 200
+    time.sleep(0.25)
+    assert service.breaker.state == 'half_open'
+    assert service._refresh(3) is not None
+    assert service.breaker.state == 'closed'
+
+
+def test_deadline_cuts_a_slow_cold_start_and_serves_mock_data(fake_hdl, make_service, request_budget):
+    fake_hdl.delay = 1.0
+    service = make_service()
+    request_budget(0.2)
+
+    started = time.monotonic()
+    catalogo = service.get_catalogo()
+
+    assert time.monotonic() - started < 0.6
+    assert len(catalogo) == len(MOCK_ARTICULOS['articulos'])
+    assert service.stats['deadline_exceeded'] == 1
+    assert 'operacion_3' not in service.cache
+
+
+def test_zero_budget_does_not_call_the_upstream(fake_hdl, make_service, request_budget):
+    service = make_service()
+    request_budget(0)
+
+    assert len(service.get_catalogo()) == len(MOCK_ARTICULOS['articulos'])
+    assert fake_hdl.calls(3) == []
+    assert service.stats['deadline_exceeded'] == 1
+
+
+def test_deadline_aborts_do_not_trip_the_breaker(fake_hdl, make_service, request_budget, breaker_env):
+    fake_hdl.delay = 0.5
+    service = make_service()
+    request_budget(0.1)
+
+    for _ in range(4):
+        service._refresh(3, fallback_to_mock=True)
+
+    assert service.stats['deadline_exceeded'] == 4
+    metrics = service.breaker.get_metrics()
+    assert metrics['state'] == 'closed'
+    assert metrics['failures'] == 0
+
+
+def test_deadline_abort_releases_the_half_open_probe(fake_hdl, make_service, request_budget, breaker_env):
+    service = make_service()
+    service.get_catalogo()
+    fake_hdl.status = 500
+    service._refresh(3)
+    time.sleep(0.25)
+
+    fake_hdl.status = 200
+    fake_hdl.delay = 0.5
+    request_budget(0.1)
+    assert service._refresh(3) is None
+    assert service.breaker.state == 'half_open'
+
+    request_budget(None)
+    fake_hdl.delay = 0
+    assert service._refresh(3) is not None
+    assert service.breaker.state == 'closed'
+
+
+def test_host_lock_wait_is_bounded_by_the_budget(fake_hdl, make_service, request_budget):
+    service = make_service()
+    service.get_catalogo()
+    os.makedirs(service.CACHE_DIR, exist_ok=True)
+    with open(os.path.join(service.CACHE_DIR, 'operacion_3.lock'), 'a') as lock_file:
+        # Otro worker del host está descargando
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        request_budget(0.2)
+        calls = len(fake_hdl.calls(3))
+
+        started = time.monotonic()
+        assert service._refresh(3) is None
+        assert time.monotonic() - started < 0.5
+        assert len(fake_hdl.calls(3)) == calls
+        assert service.stats['deadline_exceeded'] == 1
@@ -0,0 +1,22 @@
+from src.services.mock_data import MOCK_ARTICULOS
+
+
+def test_invalid_catalog_body_falls_back_to_mock_data(fake_hdl, make_service):
+    fake_hdl.bodies[3] = b'<html><body>502 Bad Gateway</body></html>'
+    service = make_service()
+
+    catalogo = service.get_catalogo()
+
+    assert catalogo.codigos == [a['codigo'] for a in MOCK_ARTICULOS['articulos']]
+    # Los datos de prueba no quedan en el cache compartido
+    assert 'operacion_3' not in service.cache
+    assert service.breaker.get_metrics()['failures'] == 1
+
+
+def test_invalid_catalog_body_keeps_previous_snapshot(fake_hdl, make_service):
+    service = make_service()
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3']
+
+    fake_hdl.bodies[3] = b'{"articulos": [{"codigo": "A1"'
+    assert service._refresh(3) is None
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3']
@@ -0,0 +1,91 @@
+import json
+import os
+
+from src.services.mock_data import MOCK_ARTICULOS
+from tests.conftest import catalog_payload
+
+
+def _snapshot(service, operacion):
+    with open(service._snapshot_path(operacion), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_snapshot_is_saved_and_reloaded(fake_hdl, make_service):
+    service = make_service()
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3']
+    assert os.path.exists(service._snapshot_path(3))
+
+    # Un proceso nuevo arranca con el snapshot sin llamar al upstream
+    fake_hdl.requests.clear()
+    restarted = make_service()
+    assert restarted.get_catalogo().codigos == ['A1', 'A2', 'A3']
+    assert fake_hdl.calls(3) == []
+
+
+def test_error_payload_does_not_replace_snapshot(fake_hdl, make_service):
+    service = make_service()
+    service.get_catalogo()
+    saved = _snapshot(service, 3)
+
+    fake_hdl.bodies[3] = json.dumps({'resultado': 0, 'error': 'Sesión vencida'}).encode()
+    assert service._refresh(3) is None
+
+    assert _snapshot(service, 3) == saved
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3']
+    assert service.breaker.get_metrics()['failures'] == 1
+
+
+def test_empty_payload_does_not_replace_snapshot(fake_hdl, make_service):
+    service = make_service()
+    service.get_catalogo()
+
+    fake_hdl.set_catalog(articulos=[])
+    assert service._refresh(3) is None
+    assert service.get_catalogo().codigos == ['A1', 'A2', 'A3']
+
+
+def test_error_payload_without_snapshot_serves_mock_data(fake_hdl, make_service):
+    fake_hdl.set_catalog(articulos=[], resultado=0)
+    service = make_service()
+
+    assert len(service.get_catalogo()) == len(MOCK_ARTICULOS['articulos'])
+    assert not os.path.exists(service._snapshot_path(3))
+
+
+def test_error_payload_for_clients_keeps_previous_data(fake_hdl, make_service):
+    fake_hdl.bodies[1] = json.dumps({'resultado': 1, 'clientes': [{'datos': {'cuit': '1', 'razon_social': 'ACME'}, 'obras': []}]}).encode()
+    service = make_service()
+    assert service.get_clientes_y_obras()['clientes'][0]['datos']['razon_social'] == 'ACME'
+
+    fake_hdl.bodies[1] = json.dumps({'resultado': 0}).encode()
+    assert service._refresh(1) is None
+    assert service.get_clientes_y_obras()['clientes'][0]['datos']['razon_social'] == 'ACME'
+
+
+def test_catalog_losing_most_articles_is_rejected(fake_hdl, make_service):
+    service = make_service()
+    service.get_catalogo()
+    version = service.get_catalogo().version
+    saved = _snapshot(service, 3)
+
+    fake_hdl.set_catalog(articulos=catalog_payload()['articulos'][:1])
+    assert service._refresh(3) is None
+
+    catalogo = service.get_catalogo()
+    assert catalogo.codigos == ['A1', 'A2', 'A3']
+    assert catalogo.version == version
+    assert service.search_articulos('arena')[0]['codigo'] == 'A2'
+    assert service.get_catalog_changes(version)['changes'] == []
+    assert _snapshot(service, 3) == saved
+
+
+def test_catalog_removing_a_minority_is_published(fake_hdl, make_service):
+    service = make_service()
+    version = service.get_catalogo().version
+
+    fake_hdl.set_catalog(articulos=catalog_payload()['articulos'][:2])
+    assert service._refresh(3) is not None
+
+    assert service.get_catalogo().codigos == ['A1', 'A2']
+    changes = service.get_catalog_changes(version)['changes']
+    assert [entry['removed'] for entry in changes] == [['A3']]
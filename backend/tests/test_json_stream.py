@@ -0,0 +1,72 @@
+import json
+import random
+
+import pytest
+
+from src.services.json_stream import iter_json_array
+
+
+def _parse(chunks, path=('articulos',)):
+    extras = {}
+    items = list(iter_json_array(chunks, path, extras))
+    return items, extras
+
+
+def _split(data: bytes, cuts):
+    bounds = [0] + sorted(cuts) + [len(data)]
+    return [data[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def test_number_split_after_decimal_point():
+    items, extras = _parse([b'{"articulos": [], "resultado": 0.', b'001, "z": {}}'])
+    assert items == []
+    assert extras == {'resultado': 0.001, 'z': {}}
+
+
+@pytest.mark.parametrize('text', ['1', '12', '-3', '0.5', '1e5', '1.5E-3', '-0.25e+2'])
+def test_numbers_split_at_every_position(text):
+    doc = f'{{"resultado": {text}, "articulos": [{text}, {{"precio": {text}}}]}}'.encode()
+    expected = json.loads(doc)
+    for cut in range(1, len(doc)):
+        items, extras = _parse(_split(doc, [cut]))
+        assert items == expected['articulos']
+        assert extras == {'resultado': expected['resultado']}
+
+
+def test_multibyte_characters_split_across_chunks():
+    doc = json.dumps({'articulos': [{'nombre': 'CAÑO ÁNGULO'}], 'resultado': 1}, ensure_ascii=False).encode()
+    for cut in range(1, len(doc)):
+        assert _parse(_split(doc, [cut]))[0] == [{'nombre': 'CAÑO ÁNGULO'}]
+
+
+def test_nested_path_and_extras():
+    doc = b'{"data": {"resultado": 1, "articulos": [{"codigo": "A"}, {"codigo": "B"}]}, "version": 2}'
+    items, extras = _parse(_split(doc, [5, 17, 40]), path=('data', 'articulos'))
+    assert items == [{'codigo': 'A'}, {'codigo': 'B'}]
+    assert extras == {'data.resultado': 1, 'version': 2}
+
+
+def test_random_chunkings_of_valid_documents():
+    rng = random.Random(20240501)
+    for _ in range(3000):
+        articulos = [
+            {
+                'codigo': str(rng.randint(1, 99999)),
+                'nombre': rng.choice(['CEMENTO', 'CAÑO 1/2"', 'ARENA x m3', 'CAL \\ HIDRÁULICA']),
+                'precios': [{'codigo': '1', 'precio': rng.choice([0, 1.5, -2.25e-3, 123456789, 1e21])}],
+                'activo': rng.choice([True, False, None]),
+            }
+            for _ in range(rng.randint(0, 4))
+        ]
+        document = {'articulos': articulos, 'resultado': rng.choice([0, 1, 0.001, -7, 2.5e10])}
+        data = json.dumps(document, ensure_ascii=False, indent=rng.choice([None, 1])).encode()
+        cuts = [rng.randint(1, len(data) - 1) for _ in range(rng.randint(1, 8))]
+        items, extras = _parse(_split(data, cuts))
+        assert items == articulos
+        assert extras == {'resultado': document['resultado']}
+
+
+@pytest.mark.parametrize('data', [b'<html>502</html>', b'{"articulos": [1, 2}', b'{"articulos": []} x'])
+def test_invalid_documents_raise(data):
+    with pytest.raises(json.JSONDecodeError):
+        _parse(_split(data, [3]))
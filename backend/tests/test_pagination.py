@@ -0,0 +1,106 @@
+import pytest
+
+from src.services.pagination import decode_cursor, encode_cursor, paginate, parse_limit, query_fingerprint
+from tests.conftest import catalog_payload
+
+
+def _bolsas(n):
+    return [
+        {'codigo': f'B{i}', 'nombre': f'BOLSA {i}', 'precios': [{'codigo': '1', 'nombre': 'Lista 1', 'precio': '1'}]}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize('value, expected', [(None, 50), (10, 10), ('10', 10), (10.0, 10), (500, 200)])
+def test_parse_limit(value, expected):
+    assert parse_limit(value, 50, 200) == expected
+
+
+@pytest.mark.parametrize('value', [0, -1, '0', 'diez', 1.5, True, [], float('inf')])
+def test_parse_limit_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_limit(value, 50, 200)
+
+
+def test_cursor_round_trip_and_rejections():
+    fingerprint = query_fingerprint('articulos', 'bolsa', False)
+    cursor = encode_cursor(3, 20, fingerprint)
+
+    assert decode_cursor(cursor, 3, fingerprint) == 20
+    assert decode_cursor(None, 3, fingerprint) == 0
+    with pytest.raises(ValueError, match='vencido'):
+        decode_cursor(cursor, 4, fingerprint)
+    with pytest.raises(ValueError, match='esta búsqueda'):
+        decode_cursor(cursor, 3, query_fingerprint('articulos', 'cemento', False))
+    for malformed in ('%%%', 'e30', encode_cursor(3, -1, fingerprint)):
+        with pytest.raises(ValueError):
+            decode_cursor(malformed, 3, fingerprint)
+
+
+def test_paginate_rejects_empty_pages():
+    with pytest.raises(ValueError):
+        paginate(['a', 'b'], 0, 0, 1, 0)
+
+
+def test_search_pages_cover_every_match_once(fake_hdl, make_service):
+    fake_hdl.set_catalog(_bolsas(7))
+    service = make_service()
+
+    seen, cursor = [], None
+    while True:
+        page = service.search_articulos_page('bolsa', limit=3, cursor=cursor)
+        assert page['total'] == 7
+        seen += [articulo['codigo'] for articulo in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(f'B{i}' for i in range(7))
+    assert seen == [articulo['codigo'] for articulo in service.search_articulos('bolsa', limit=7)]
+
+
+def test_cursor_expires_when_the_catalog_changes(fake_hdl, make_service):
+    fake_hdl.set_catalog(_bolsas(5))
+    service = make_service()
+    first = service.search_articulos_page('bolsa', limit=2)
+
+    fake_hdl.set_catalog(_bolsas(6))
+    service._refresh(3)
+
+    with pytest.raises(ValueError, match='vencido'):
+        service.search_articulos_page('bolsa', limit=2, cursor=first['next_cursor'])
+    assert service.search_articulos_page('bolsa', limit=2)['total'] == 6
+
+
+def test_cursor_survives_a_refresh_without_changes(fake_hdl, make_service):
+    fake_hdl.set_catalog(_bolsas(5))
+    service = make_service()
+    first = service.search_articulos_page('bolsa', limit=2)
+
+    service._refresh(3)
+
+    second = service.search_articulos_page('bolsa', limit=2, cursor=first['next_cursor'])
+    assert len(second['items']) == 2
+
+
+def test_cursor_of_another_query_is_rejected(fake_hdl, make_service):
+    fake_hdl.set_catalog(_bolsas(5))
+    service = make_service()
+    cursor = service.search_articulos_page('bolsa', limit=2)['next_cursor']
+
+    with pytest.raises(ValueError, match='esta búsqueda'):
+        service.search_articulos_page('bolsa', limit=2, cursor=cursor, fuzzy=True)
+    with pytest.raises(ValueError, match='esta búsqueda'):
+        service.search_articulos_page('bolsa 1', limit=2, cursor=cursor)
+
+
+@pytest.mark.parametrize('query', ['!!!', '   ', '-- ..'])
+def test_query_without_terms_returns_an_empty_page(fake_hdl, make_service, query):
+    page = make_service().search_articulos_page(query, limit=2)
+    assert page == {'items': [], 'total': 0, 'next_cursor': None}
+
+
+def test_search_page_only_returns_matches(fake_hdl, make_service):
+    fake_hdl.set_catalog(catalog_payload()['articulos'] + _bolsas(2))
+    page = make_service().search_articulos_page('cemento', limit=10)
+    assert [articulo['codigo'] for articulo in page['items']] == ['A1']